@@ -60,9 +60,18 @@
 # 4. counter / 10,000 equals the probability of getting a chi-squared greater tha or equal to
 #    0.97, if wealth has no influence on health
 #
+# Included in the code, but NOT in the pseudocode, is a numpy version of
+# step (3a) (set method = "numpy" below).  Rather than expanding the matrix into
+# one entry per observation and shuffling them, it draws every new matrix
+# directly, one cell at a time: the count in a cell is a hypergeometric draw
+# of the values still available in its row from the values still available in
+# the remaining columns.  All num_runs matrices are drawn at once, so the cost
+# depends on the number of cells and not on the number of observations.
+#
 ######################################
 
 import random
+import numpy
 
 ######################################
 #
@@ -71,6 +80,7 @@ import random
 ######################################
 
 input_file = "chisquaredmulti.vals"
+method = "shuffle"	# "shuffle" (as in the pseudocode) or "numpy" (draws matrices directly)
 
 ######################################
 #
@@ -126,6 +136,43 @@ def shuffle(observed, num_rows, num_cols):
 		new_counts[(row_vals[i] * num_cols) + col_vals[i]] += 1
 	return new_counts
 				
+# draws num_tables random matrices with the given row and column totals
+# (the same distribution shuffle gives us) using sequential hypergeometric draws
+# returns a num_tables x (num_rows * num_cols) array, each row ordered like observed
+def sampletables(row_totals, column_totals, num_tables):
+	num_rows = len(row_totals)
+	num_cols = len(column_totals)
+	tables = numpy.zeros((num_tables, num_rows * num_cols), dtype=numpy.int64)
+	# keeps track of the available values for each column, in every table
+	available_column_vals = numpy.empty((num_tables, num_cols), dtype=numpy.int64)
+	available_column_vals[:] = numpy.array(column_totals, dtype=numpy.int64)
+	for r in range(num_rows):
+		if r == num_rows - 1:
+			# the last row gets whatever is left in each column
+			tables[:, r * num_cols:] = available_column_vals
+			break
+		# the values of this row still to be placed
+		left_in_row = numpy.empty(num_tables, dtype=numpy.int64)
+		left_in_row[:] = int(row_totals[r])
+		# values available in this column and the columns after it
+		left_in_cols = available_column_vals.sum(axis=1)
+		for c in range(num_cols):
+			left_in_cols -= available_column_vals[:, c]
+			if c == num_cols - 1:
+				new_vals = left_in_row
+			else:
+				new_vals = hypergeometric(available_column_vals[:, c], left_in_cols, left_in_row)
+			tables[:, r * num_cols + c] = new_vals
+			available_column_vals[:, c] -= new_vals
+			left_in_row = left_in_row - new_vals
+	return tables
+
+# numpy.random.hypergeometric, except a sample of size 0 is allowed (and gives 0)
+def hypergeometric(ngood, nbad, nsample):
+	empty = nsample == 0
+	draws = numpy.random.hypergeometric(numpy.where(empty, 1, ngood), nbad, numpy.where(empty, 1, nsample))
+	return numpy.where(empty, 0, draws)
+
 def chisquared(expected, observed):
 	count = len(expected)
 	total = 0
@@ -171,11 +218,17 @@ observed_chi_squared = chisquared(expected, observed)
 count = 0
 num_runs = 10000
 
-for i in range(num_runs):
-	shuffled_observed = shuffle(observed, len(row_totals), len(column_totals))
-	chi_squared = chisquared(expected, shuffled_observed)
-	if (chi_squared >= observed_chi_squared):
-		count = count + 1
+if method == "numpy":
+	tables = sampletables(row_totals, column_totals, num_runs)
+	expected_vals = numpy.array(expected)
+	chi_squareds = (((tables - expected_vals)**2) / expected_vals).sum(axis=1)
+	count = int(numpy.count_nonzero(chi_squareds >= observed_chi_squared))
+else:
+	for i in range(num_runs):
+		shuffled_observed = shuffle(observed, len(row_totals), len(column_totals))
+		chi_squared = chisquared(expected, shuffled_observed)
+		if (chi_squared >= observed_chi_squared):
+			count = count + 1
 
 ######################################
 #
@@ -44,9 +44,17 @@
 # 3. counter / 10,000 equals the probability of getting a chi-squared greater than or equal to
 #    9.4, if the die is in fact fair.
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (3) (set method = "numpy" below).  Instead of drawing one
+# observation at a time, each experiment's counts are drawn at once from the
+# multinomial distribution given by the expected counts, chunk_size experiments
+# at a time, and chi-squared is computed for the whole chunk together.  The cost
+# depends on the number of categories and not on the number of observations.
+#
 ######################################
 
 import random
+import numpy
 
 ######################################
 #
@@ -55,6 +63,8 @@ import random
 ######################################
 
 input_file = "ChiSquared.vals"
+method = "draw"	# "draw" (as in the pseudocode) or "numpy" (batched)
+chunk_size = 1000	# number of experiments drawn at once when method is "numpy"
 
 ######################################
 #
@@ -99,6 +109,20 @@ def chisquared(expected, observed):
 		total += ((observed[i] - expected[i])**2) / float(expected[i])
 	return total
 
+# same as calling chisquared(expected, drawfromcategories(num, expected))
+# num_runs times, but computed chunk_size experiments at a time with numpy
+# returns an array with the chi-squared of each experiment
+def batchedchisquareds(num, expected, num_runs, chunk_size):
+	expected_vals = numpy.array(expected, dtype=float)
+	probs = expected_vals / expected_vals.sum()
+	chi_squareds = numpy.empty(num_runs)
+	for start in range(0, num_runs, chunk_size):
+		num_rows = min(chunk_size, num_runs - start)
+		# one row of counts per experiment
+		simulated_observed = numpy.random.multinomial(num, probs, size=num_rows)
+		chi_squareds[start:start + num_rows] = (((simulated_observed - expected_vals)**2) / expected_vals).sum(axis=1)
+	return chi_squareds
+
 ######################################
 #
 # Computations
@@ -129,12 +153,16 @@ num_observations = int(sum(observed))
 count = 0
 num_runs = 10000
 
-for i in range(num_runs):
-	# roll a fair die num_observations times, counting the results
-	simulated_observed = drawfromcategories(num_observations, expected)
-	chi_squared = chisquared(expected, simulated_observed)
-	if (chi_squared >= observed_chi_squared):
-		count = count + 1
+if method == "numpy":
+	chi_squareds = batchedchisquareds(num_observations, expected, num_runs, chunk_size)
+	count = int(numpy.count_nonzero(chi_squareds >= observed_chi_squared))
+else:
+	for i in range(num_runs):
+		# roll a fair die num_observations times, counting the results
+		simulated_observed = drawfromcategories(num_observations, expected)
+		chi_squared = chisquared(expected, simulated_observed)
+		if (chi_squared >= observed_chi_squared):
+			count = count + 1
 
 ######################################
 #
@@ -34,9 +34,19 @@
 # 3. counter / 10,000 equals the probability of getting an observed number of heads greater than or equal to 15
 #    in 17 tosses if the coin is fair.
 #
+# Included in the code, but NOT in the pseudocode, are two other versions of
+# step (2) (set method below).  With method = "exact" no tosses are simulated:
+# the probability of getting exactly k heads in 17 tosses is
+# 17! / (k! (17 - k)!) * p^k * (1 - p)^(17 - k), so we add it up for k = 15, 16 and 17.
+# With method = "numpy" the number of heads in each experiment is drawn at once
+# from the binomial distribution, chunk_size experiments at a time.  Both the
+# exact and the numpy version also take arrays for the number of heads, tosses
+# and p, and then give the probability for each combination in one call.
+#
 ######################################
 
 import random
+import numpy
 
 ######################################
 #
@@ -47,6 +57,8 @@ import random
 observed_number_of_heads = 15
 number_of_tosses = 17  
 probability_of_head = 0.5 
+method = "simulate"	# "simulate" (as in the pseudocode), "exact" or "numpy" (batched)
+chunk_size = 1000	# number of experiments drawn at once when method is "numpy"
 
 ######################################
 #
@@ -66,6 +78,52 @@ def applyprob(p, n):
 			success = success + 1
 	return success
 
+# returns the exact probability of getting at least k successes
+# out of n trials, when each trial succeeds with probability p
+# k, n and p can be numbers or arrays, as for batchedprobs, and every
+# combination is computed at once with numpy (a number for numbers)
+# computed with logarithms, so large n does not overflow
+def prob_at_least(k, n, p):
+	(k, n, p) = numpy.broadcast_arrays(numpy.asarray(k), numpy.asarray(n), numpy.asarray(p, dtype=float))
+	max_n = int(n.max())
+	# log_fact[i] is log(i!)
+	log_fact = numpy.zeros(max_n + 1)
+	log_fact[1:] = numpy.cumsum(numpy.log(numpy.arange(1, max_n + 1)))
+	# the number of successes j runs along a new last axis
+	j = numpy.arange(max_n + 1)
+	k_j = k[..., numpy.newaxis]
+	n_j = n[..., numpy.newaxis]
+	# p of 0 or 1 is handled below, 0.5 keeps the logarithms finite meanwhile
+	p_j = numpy.where((p > 0) & (p < 1), p, 0.5)[..., numpy.newaxis]
+	fails = numpy.maximum(n_j - j, 0)
+	# log of n! / (j! (n - j)!) * p^j * (1 - p)^(n - j)
+	log_probs = log_fact[n_j] - log_fact[j] - log_fact[fails] + j * numpy.log(p_j) + fails * numpy.log(1 - p_j)
+	in_tail = (j >= k_j) & (j <= n_j)
+	probs = numpy.where(in_tail, numpy.exp(log_probs), 0.0).sum(axis=-1)
+	# every trial fails, or every trial succeeds
+	probs = numpy.where(p <= 0, k <= 0, probs)
+	probs = numpy.where(p >= 1, k <= n, probs)
+	probs = numpy.where(k <= 0, 1.0, probs)
+	return numpy.minimum(probs, 1.0)[()]
+
+# same as counting how many of num_runs calls to applyprob(p, n) give
+# at least k successes, but computed chunk_size experiments at a time with numpy
+# k, n and p can be numbers or arrays (of the same shape, or that numpy can
+# broadcast to one shape), one entry per combination we want to check
+# returns the fraction of experiments with at least k successes for each combination
+def batchedprobs(k, n, p, num_runs, chunk_size):
+	k = numpy.asarray(k)
+	n = numpy.asarray(n)
+	p = numpy.asarray(p, dtype=float)
+	shape = numpy.broadcast(k, n, p).shape
+	counts = numpy.zeros(shape, dtype=numpy.int64)
+	for start in range(0, num_runs, chunk_size):
+		num_rows = min(chunk_size, num_runs - start)
+		# one row of numbers of successes per experiment
+		successes = numpy.random.binomial(n, p, size=(num_rows,) + shape)
+		counts += numpy.count_nonzero(successes >= k, axis=0)
+	return counts / float(num_runs)
+
 ######################################
 #
 # Computations
@@ -76,11 +134,17 @@ countgood = 0
 number_of_bootstraps = 10000
 out=[]
 
-for i in range(number_of_bootstraps):
-	out.append(applyprob(probability_of_head,number_of_tosses))
+if method == "exact":
+	exact_prob = float(prob_at_least(observed_number_of_heads, number_of_tosses, probability_of_head))
+elif method == "numpy":
+	prob = batchedprobs(observed_number_of_heads, number_of_tosses, probability_of_head, number_of_bootstraps, chunk_size)
+	countgood = int(round(prob * number_of_bootstraps))
+else:
+	for i in range(number_of_bootstraps):
+		out.append(applyprob(probability_of_head,number_of_tosses))
 	   
-# count the number of times we got greater than or equal to 15 heads out of 17 coin tosses
-countgood = len(filter(lambda x: x >= observed_number_of_heads, out))
+	# count the number of times we got greater than or equal to 15 heads out of 17 coin tosses
+	countgood = len(filter(lambda x: x >= observed_number_of_heads, out))
 
 ######################################
 #
@@ -88,7 +152,11 @@ countgood = len(filter(lambda x: x >= observed_number_of_heads, out))
 #
 ######################################
 
-print countgood, "out of", number_of_bootstraps, "times we got at least", 
-print observed_number_of_heads, "heads in", number_of_tosses, "tosses."
-print "Probability that chance alone gave us at least", observed_number_of_heads, 
-print "heads in", number_of_tosses, "tosses is", countgood / float(number_of_bootstraps), "."
+if method == "exact":
+	print "Exact probability that chance alone gave us at least", observed_number_of_heads, 
+	print "heads in", number_of_tosses, "tosses is", exact_prob, "."
+else:
+	print countgood, "out of", number_of_bootstraps, "times we got at least", 
+	print observed_number_of_heads, "heads in", number_of_tosses, "tosses."
+	print "Probability that chance alone gave us at least", observed_number_of_heads, 
+	print "heads in", number_of_tosses, "tosses is", countgood / float(number_of_bootstraps), "."
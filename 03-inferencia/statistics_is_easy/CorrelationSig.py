@@ -49,10 +49,19 @@
 # 3. counter / 10,000 equals the probability of getting a r greater than or equal to
 #    0.58, assuming there is no difference between the groups
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (3) (set method = "numpy" below).  Shuffling y only changes
+# which y is paired with which x: the means and the sums of squares stay the same.
+# So we center the x and y values and divide them by the square root of their
+# sums of squares once, and then r for a shuffle is just the sum of the products
+# of the pairs.  The shuffles are drawn chunk_size at a time, as a matrix with one
+# shuffled y per row, and one matrix-vector product gives r for all of them.
+#
 ######################################
 
 import math
 import random
+import numpy
 
 ######################################
 #
@@ -61,6 +70,9 @@ import random
 ######################################
 
 input_file = 'Correlation.vals'
+method = "shuffle"	# "shuffle" (as in the pseudocode) or "numpy" (batched)
+chunk_size = 100	# number of shuffles drawn at once when method is "numpy",
+			# lower it for very large samples (it uses chunk_size * len(grp_y) values)
 
 ######################################
 #
@@ -101,6 +113,25 @@ def corrcoef(x, y):
 
 	return sum_of_prod / math.sqrt(sum_of_sq_x * sum_of_sq_y)
 
+# same as calling corrcoef(x, y) after each of num_shuffles shuffles of y,
+# but computed chunk_size shuffles at a time with numpy
+# returns an array with the r of each shuffle
+def batchedcorrcoefs(x, y, num_shuffles, chunk_size):
+	x_vals = numpy.array(x, dtype=float)
+	y_vals = numpy.array(y, dtype=float)
+	x_vals -= x_vals.mean()
+	y_vals -= y_vals.mean()
+	x_vals /= math.sqrt((x_vals**2).sum())
+	y_vals /= math.sqrt((y_vals**2).sum())
+	rs = numpy.empty(num_shuffles)
+	shuffled = numpy.empty((chunk_size, len(y_vals)))
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		# one shuffled y per row
+		for i in range(num_rows):
+			shuffled[i] = numpy.random.permutation(y_vals)
+		rs[start:start + num_rows] = shuffled[:num_rows].dot(x_vals)
+	return rs
 
 ######################################
 #
@@ -129,12 +160,22 @@ observed_r = corrcoef(grp_x, grp_y)
 count = 0
 num_shuffles = 10000
 
-for i in range(num_shuffles):
-	# we want to break the relationship between the pairs, so just shuffle one group 
-	random.shuffle(grp_y)
-	r = corrcoef(grp_x, grp_y)
-	if (observed_r > 0 and r >= observed_r) or (observed_r < 0 and r <= observed_r):
-		count = count + 1
+if method == "numpy":
+	rs = batchedcorrcoefs(grp_x, grp_y, num_shuffles, chunk_size)
+	# the r values are computed as a dot product of the normalized values, not as
+	# corrcoef does: r values this close to observed (towards zero) are ties
+	threshold = observed_r * (1 - 1e-9)
+	if observed_r > 0:
+		count = int(numpy.count_nonzero(rs >= threshold))
+	elif observed_r < 0:
+		count = int(numpy.count_nonzero(rs <= threshold))
+else:
+	for i in range(num_shuffles):
+		# we want to break the relationship between the pairs, so just shuffle one group 
+		random.shuffle(grp_y)
+		r = corrcoef(grp_x, grp_y)
+		if (observed_r > 0 and r >= observed_r) or (observed_r < 0 and r <= observed_r):
+			count = count + 1
 
 ######################################
 #
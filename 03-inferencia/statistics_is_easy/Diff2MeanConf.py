@@ -43,11 +43,22 @@
 #
 # 6. The bootstrap values at the lower bound and upper bound give us our confidence interval.
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy version of step (2)
+# (set method = "numpy" below), which draws chunk_size bootstrap samples of each group at
+# once, as a matrix of picked values with one row per bootstrap.
+#
+# Instead of means, the interval can be for the difference between two medians or other
+# quantiles (set statistic below to "median", "p95", "p99", ...).  The "numpy" method does
+# not sort each bootstrap sample to find them: numpy.partition only moves the one or two
+# values the quantile needs into their sorted places, for every row of the chunk at once,
+# in time linear in the size of the groups.
+#
 ###################################### 
 
 import random
 import math
 import sys
+import numpy
 
 ######################################
 #
@@ -57,6 +68,9 @@ import sys
 
 input_file = "Diff2Mean.vals"
 conf_interval = 0.9
+statistic = "mean"	# "mean", "median", or a percentile: "p90", "p95", "p99", ...
+method = "bootstrap"	# "bootstrap" (as in the pseudocode) or "numpy" (batched)
+chunk_size = 1000	# number of bootstraps drawn at once when method is "numpy"
 
 ######################################
 #
@@ -77,6 +91,54 @@ def bootstrap(x):
 def meandiff(grpA, grpB):
 	return sum(grpB) / float(len(grpB)) - sum(grpA) / float(len(grpA))
 
+# the quantile a percentile statistic stands for: "p95" is 0.95
+def quantileof(statistic):
+	return float(statistic[1:]) / 100
+
+# the q quantile of vals (0.5 for the median): the value at position (len(vals) - 1) * q
+# of the sorted values, interpolated between the two values around it
+def quantile(vals, q):
+	vals = sorted(vals)
+	pos = (len(vals) - 1) * q
+	low = int(math.floor(pos))
+	high = min(low + 1, len(vals) - 1)
+	return vals[low] + (pos - low) * (vals[high] - vals[low])
+
+# subtracts the group a statistic from the group b statistic and returns result
+# q is None for the difference of means
+def statdiff(grpA, grpB, q):
+	if q is None:
+		return meandiff(grpA, grpB)
+	return quantile(grpB, q) - quantile(grpA, q)
+
+# the q quantile of each row of vals (a numpy matrix), the same as calling quantile
+# on every row, but numpy.partition only puts the one or two values needed in their
+# sorted places (in time linear in the length of the rows) instead of sorting the rows
+def batchedquantiles(vals, q):
+	pos = (vals.shape[1] - 1) * q
+	low = int(math.floor(pos))
+	high = min(low + 1, vals.shape[1] - 1)
+	vals = numpy.partition(vals, sorted(set([low, high])), axis=1)
+	return vals[:, low] + (pos - low) * (vals[:, high] - vals[:, low])
+
+# same as calling statdiff on num_resamples pairs of bootstrap(grpA) and bootstrap(grpB),
+# but computed chunk_size bootstraps at a time with numpy
+# returns an array with the difference for each bootstrap
+def batchedstatdiffs(grpA, grpB, q, num_resamples, chunk_size):
+	vals_a = numpy.array(grpA, dtype=float)
+	vals_b = numpy.array(grpB, dtype=float)
+	diffs = numpy.empty(num_resamples)
+	for start in range(0, num_resamples, chunk_size):
+		num_rows = min(chunk_size, num_resamples - start)
+		# one bootstrap sample of each group per row
+		boot_a = vals_a[numpy.random.randint(0, len(vals_a), size=(num_rows, len(vals_a)))]
+		boot_b = vals_b[numpy.random.randint(0, len(vals_b), size=(num_rows, len(vals_b)))]
+		if q is None:
+			diffs[start:start + num_rows] = boot_b.mean(axis=1) - boot_a.mean(axis=1)
+		else:
+			diffs[start:start + num_rows] = batchedquantiles(boot_b, q) - batchedquantiles(boot_a, q)
+	return diffs
+
 ######################################
 #
 # Computations
@@ -99,20 +161,32 @@ for line in infile:
 		samples[len(samples) - 1] += map(float,line.split())
 infile.close()
 
-observed_mean_diff = meandiff(samples[a], samples[b])
+if statistic == "mean":
+	q = None
+	stat_name = "means"
+elif statistic == "median":
+	q = 0.5
+	stat_name = "medians"
+else:
+	q = quantileof(statistic)
+	stat_name = statistic + " values"
+observed_diff = statdiff(samples[a], samples[b], q)
 
 num_resamples = 10000   # number of times we will resample from our original samples
 out = []                # will store results of each time we resample
 
-for i in range(num_resamples):
-	# get bootstrap samples for each of our groups
-	# then compute our statistic of interest
-	# append statistic to out
-	bootstrap_samples = []  # list of lists
-	for sample in samples:
-		bootstrap_samples.append(bootstrap(sample))
-	# now we have a list of bootstrap samples, run meandiff
-	out.append(meandiff(bootstrap_samples[a], bootstrap_samples[b]))
+if method == "numpy":
+	out = batchedstatdiffs(samples[a], samples[b], q, num_resamples, chunk_size)
+else:
+	for i in range(num_resamples):
+		# get bootstrap samples for each of our groups
+		# then compute our statistic of interest
+		# append statistic to out
+		bootstrap_samples = []  # list of lists
+		for sample in samples:
+			bootstrap_samples.append(bootstrap(sample))
+		# now we have a list of bootstrap samples, run statdiff
+		out.append(statdiff(bootstrap_samples[a], bootstrap_samples[b], q))
 
 out.sort()
 
@@ -131,6 +205,6 @@ upper_bound = int(math.floor(num_resamples * (1 - tails)))
 ######################################
 
 # print observed value and then confidence interval
-print "Observed difference between the means: %.2f" % observed_mean_diff
-print "We have", conf_interval * 100, "% confidence that the true difference between the means",
+print "Observed difference between the %s: %.2f" % (stat_name, observed_diff)
+print "We have", conf_interval * 100, "% confidence that the true difference between the", stat_name,
 print "is between: %.2f" % out[lower_bound], "and %.2f" % out[upper_bound]
@@ -39,9 +39,55 @@
 # 4. counter / 10,000 equals the probability of getting our observed difference of two means greater than
 #    or equal to 12.97, if there is in fact no significant difference.
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (3) (set method = "numpy" below).  It draws the shuffles
+# in chunks as a matrix of pool indexes, one row per shuffle.  Because the
+# total of all values never changes, only the members of the smaller group
+# are drawn: the sum of the other group is the total minus that sum.  When the
+# smaller group is small next to the pool (at most the square root of its size),
+# its members are drawn by Floyd's algorithm, without a step for the rest of the
+# pool; otherwise every pooled value gets a random key and the smallest keys win.
+#
+# The same idea without numpy is method = "subset": each shuffle only moves the
+# members of the smaller group to the front of an index into the pooled values
+# (a partial Fisher-Yates shuffle), so a shuffle takes min(len(grpA), len(grpB))
+# steps however large the other group is, and nothing is copied.
+#
+# When the values have many ties (star ratings, coarse latency buckets) there is
+# method = "counts": the pool is kept as each distinct value and how many times it
+# appears, and a shuffle only draws how many copies of each value end up in group a
+# (a hypergeometric draw per value, chunk_size shuffles at a time with numpy).
+# A shuffle then costs one draw per distinct value, however many values there are.
+#
+# Also included is an exact version (method = "exact").  With method = "auto" it is
+# used when there are at most exact_limit ways to split the pooled values into the two
+# groups (for our example 19! / (10! 9!) = 92,378), and "shuffle" is used otherwise;
+# any other method is always used as given.  Instead of shuffling, it
+# tries every one of these splits once, so counter / number of splits is the
+# exact probability.  The splits are visited in "revolving door" order, where
+# each split differs from the one before by swapping one value of group a with
+# one value of group b, so the sum of group a only needs one add and one subtract.
+#
+# For whole-number values (counts, milliseconds, ...) there is a second exact
+# version (method = "subsetsum") that works for groups of hundreds of values.  The
+# difference of means only depends on the sum of group a: the larger that sum,
+# the smaller the difference.  So we only need the chance of each possible sum of
+# len(grpA) values picked from the pool, and we get it by going through the pooled
+# values one at a time, keeping the chance of each sum for each number of values
+# picked so far, instead of trying every split.
+#
+# Instead of means, the test can compare medians or other quantiles (set statistic
+# below to "median", "p95", "p99", ...), which say more about tail latency than the
+# mean does.  Only the "shuffle" and "numpy" methods work for these.  The "numpy" one
+# does not sort each shuffled group: numpy.partition only moves the one or two values
+# the quantile needs into their sorted places, for every shuffle of the chunk at once,
+# in time linear in the size of the groups.
+#
 ######################################
 
 import random
+import math
+import numpy
 
 ######################################
 #
@@ -50,6 +96,11 @@ import random
 ######################################
 
 input_file = "Diff2Mean.vals"
+statistic = "mean"	# "mean", "median", or a percentile: "p90", "p95", "p99", ...
+method = "auto"	# "shuffle" (as in the pseudocode), "subset", "numpy" (batched), "counts",
+			# "exact", "subsetsum", or "auto" ("exact" if there are few splits, else "shuffle")
+chunk_size = 1000	# number of shuffles drawn at once when method is "numpy" or "counts"
+exact_limit = 100000	# method "auto" is "exact" if there are at most this many splits
 
 ######################################
 #
@@ -85,6 +136,279 @@ def shuffle(grps):
 def meandiff(grpA, grpB):
 	return sum(grpB) / float(len(grpB)) - sum(grpA) / float(len(grpA))
 
+# the quantile a percentile statistic stands for: "p95" is 0.95
+def quantileof(statistic):
+	return float(statistic[1:]) / 100
+
+# the q quantile of vals (0.5 for the median): the value at position (len(vals) - 1) * q
+# of the sorted values, interpolated between the two values around it
+def quantile(vals, q):
+	vals = sorted(vals)
+	pos = (len(vals) - 1) * q
+	low = int(math.floor(pos))
+	high = min(low + 1, len(vals) - 1)
+	return vals[low] + (pos - low) * (vals[high] - vals[low])
+
+# subtracts the group a statistic from the group b statistic and returns result
+# q is None for the difference of means
+def statdiff(grpA, grpB, q):
+	if q is None:
+		return meandiff(grpA, grpB)
+	return quantile(grpB, q) - quantile(grpA, q)
+
+# the q quantile of each row of vals (a numpy matrix), the same as calling quantile
+# on every row, but numpy.partition only puts the one or two values needed in their
+# sorted places (in time linear in the length of the rows) instead of sorting the rows
+def batchedquantiles(vals, q):
+	pos = (vals.shape[1] - 1) * q
+	low = int(math.floor(pos))
+	high = min(low + 1, vals.shape[1] - 1)
+	vals = numpy.partition(vals, sorted(set([low, high])), axis=1)
+	return vals[:, low] + (pos - low) * (vals[:, high] - vals[:, low])
+
+# same as calling statdiff on num_shuffles results of shuffle([grpA, grpB]) with
+# a quantile q, but computed chunk_size shuffles at a time with numpy
+# returns an array with the difference of quantiles for each shuffle
+def batchedquantilediffs(grpA, grpB, q, num_shuffles, chunk_size):
+	pool = numpy.array(grpA + grpB, dtype=float)
+	len_a = len(grpA)
+	diffs = numpy.empty(num_shuffles)
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		# the values with the len_a smallest random keys form group a, the rest group b
+		keys = numpy.random.random_sample((num_rows, len(pool)))
+		index = numpy.argpartition(keys, len_a - 1, axis=1)
+		new_pool = pool[index]
+		diffs[start:start + num_rows] = batchedquantiles(new_pool[:, len_a:], q) - batchedquantiles(new_pool[:, :len_a], q)
+	return diffs
+
+# returns a num_rows x num_picked matrix, each row the indexes of num_picked
+# values picked at random (without replacement) from n values
+def pickedindexes(n, num_picked, num_rows):
+	if num_picked * num_picked <= n:
+		# Floyd's algorithm: for j from n - num_picked to n - 1, pick a random index
+		# from 0 to j, or j itself if that one was picked already
+		# num_picked^2 steps per row instead of n, for small picks from many values
+		picked = numpy.empty((num_rows, num_picked), dtype=int)
+		for i in range(num_picked):
+			j = n - num_picked + i
+			new_index = numpy.random.randint(0, j + 1, size=num_rows)
+			seen = (picked[:, :i] == new_index[:, numpy.newaxis]).any(axis=1)
+			picked[:, i] = numpy.where(seen, j, new_index)
+		return picked
+	# give every value a random key in every row,
+	# the values with the num_picked smallest keys are picked
+	keys = numpy.random.random_sample((num_rows, n))
+	return numpy.argpartition(keys, num_picked - 1, axis=1)[:, :num_picked]
+
+# same as calling meandiff on num_shuffles results of shuffle([grpA, grpB]),
+# but computed chunk_size shuffles at a time with numpy
+# returns an array with the difference of means for each shuffle
+def batchedmeandiffs(grpA, grpB, num_shuffles, chunk_size):
+	pool = numpy.array(grpA + grpB, dtype=float)
+	total = pool.sum()
+	len_a = len(grpA)
+	len_b = len(grpB)
+	# we only pick the members of the smaller group and add them up,
+	# the rest of the pool goes to the other group
+	num_picked = min(len_a, len_b)
+	diffs = numpy.empty(num_shuffles)
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		index = pickedindexes(len(pool), num_picked, num_rows)
+		picked_sum = pool[index].sum(axis=1)
+		if len_a <= len_b:
+			sum_a = picked_sum
+			sum_b = total - picked_sum
+		else:
+			sum_b = picked_sum
+			sum_a = total - picked_sum
+		diffs[start:start + num_rows] = sum_b / float(len_b) - sum_a / float(len_a)
+	return diffs
+
+# same as batchedmeandiffs, but with the pool kept as (value, count) pairs:
+# each shuffle draws how many copies of each value go to group a
+# returns an array with the difference of means for each shuffle
+def tiedmeandiffs(grpA, grpB, num_shuffles, chunk_size):
+	(values, value_counts) = numpy.unique(grpA + grpB, return_counts=True)
+	len_a = len(grpA)
+	len_b = len(grpB)
+	total = (values * value_counts).sum()
+	diffs = numpy.empty(num_shuffles)
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		sum_a = numpy.zeros(num_rows)
+		# places in group a not filled yet, in each shuffle
+		left_a = numpy.empty(num_rows, dtype=int)
+		left_a[:] = len_a
+		# values not placed yet, after the current one
+		left_pool = len_a + len_b
+		for i in range(len(values)):
+			left_pool -= value_counts[i]
+			# group a gets left_a of the value_counts[i] copies of this value and the
+			# left_pool values after it, so the number of copies it gets is hypergeometric
+			# (numpy does not take a sample of 0, those shuffles get 0 copies)
+			empty = left_a == 0
+			copies = numpy.random.hypergeometric(value_counts[i], left_pool, numpy.where(empty, 1, left_a))
+			copies[empty] = 0
+			sum_a += copies * values[i]
+			left_a -= copies
+		diffs[start:start + num_rows] = (total - sum_a) / float(len_b) - sum_a / float(len_a)
+	return diffs
+
+# same as calling meandiff on num_shuffles results of shuffle([grpA, grpB]),
+# but each shuffle only picks the members of the smaller group
+# returns a list with the difference of means for each shuffle
+def subsetmeandiffs(grpA, grpB, num_shuffles):
+	pool = grpA + grpB
+	total = sum(pool)
+	len_a = len(grpA)
+	len_b = len(grpB)
+	num_picked = min(len_a, len_b)
+	# positions of the pooled values, the picked ones are moved to the front;
+	# whatever order the last shuffle left it in, the next pick is just as random
+	index = range(len(pool))
+	diffs = []
+	for i in range(num_shuffles):
+		picked_sum = 0
+		for k in range(num_picked):
+			# partial Fisher-Yates: swap a random position from k on into position k
+			j = random.randint(k, len(pool) - 1)
+			(index[k], index[j]) = (index[j], index[k])
+			picked_sum += pool[index[k]]
+		if len_a <= len_b:
+			sum_a = picked_sum
+			sum_b = total - picked_sum
+		else:
+			sum_b = picked_sum
+			sum_a = total - picked_sum
+		diffs.append(sum_b / float(len_b) - sum_a / float(len_a))
+	return diffs
+
+# number of different ways to split len_a + len_b values into
+# a group of len_a values and a group of len_b values, C(len_a + len_b, len_a)
+# stops counting as soon as there are more than limit (and returns a number above limit)
+def numsplits(len_a, len_b, limit):
+	k = min(len_a, len_b)
+	total = 1
+	# C(n, k) = (n - k + 1) / 1 * (n - k + 2) / 2 * ... * n / k
+	for i in range(1, k + 1):
+		total = total * (len_a + len_b - k + i) // i
+		if total > limit:
+			break
+	return total
+
+# walks through every way of choosing t of the positions 0 .. n - 1 in revolving
+# door order (Knuth, The Art of Computer Programming 7.2.1.3, Algorithm R): the
+# first choice is 0 .. t - 1, and each next one swaps one position out and one in
+# yields (out, in) for each step
+def revolvingdoor(n, t):
+	if t == 0 or t == n:
+		return
+	if t == 1:
+		# the algorithm needs t > 1, one position just walks along
+		for i in range(n - 1):
+			yield (i, i + 1)
+		return
+	# c[1] < c[2] < ... < c[t] are the chosen positions, c[t + 1] = n is a sentinel
+	c = [None] + range(t) + [n]
+	while True:
+		if t % 2 == 1:
+			if c[1] + 1 < c[2]:
+				yield (c[1], c[1] + 1)
+				c[1] += 1
+				continue
+			j = 2
+			decrease = True
+		else:
+			if c[1] > 0:
+				yield (c[1], c[1] - 1)
+				c[1] -= 1
+				continue
+			j = 2
+			decrease = False
+		while True:
+			if decrease:
+				# try to decrease c[j]
+				if c[j] >= j:
+					yield (c[j], j - 2)
+					(c[j], c[j - 1]) = (c[j - 1], j - 2)
+					break
+				j += 1
+			else:
+				# try to increase c[j]
+				if c[j] + 1 < c[j + 1]:
+					yield (c[j - 1], c[j] + 1)
+					(c[j - 1], c[j]) = (c[j], c[j] + 1)
+					break
+				j += 1
+				if j > t:
+					return
+			decrease = not decrease
+
+# tries every way of splitting the values of grpA and grpB into groups of the same sizes
+# returns the number of splits with a difference of means as extreme as the observed one
+# or more extreme, and the number of splits
+def exactcount(grpA, grpB, observed_mean_diff):
+	pool = grpA + grpB
+	len_a = len(grpA)
+	len_b = len(grpB)
+	total = sum(pool)
+	# the first split puts the first len_a values in group a
+	sum_a = sum(pool[:len_a])
+	# the running sum picks up rounding errors, splits this close to observed are ties
+	tolerance = 1e-9 * max([abs(val) for val in pool])
+	count = 0
+	num_splits = 0
+	steps = revolvingdoor(len(pool), len_a)
+	while True:
+		mean_diff = (total - sum_a) / float(len_b) - sum_a / float(len_a)
+		if observed_mean_diff < 0 and mean_diff <= observed_mean_diff + tolerance:
+			count = count + 1
+		elif observed_mean_diff >= 0 and mean_diff >= observed_mean_diff - tolerance:
+			count = count + 1
+		num_splits = num_splits + 1
+		step = next(steps, None)
+		if step is None:
+			break
+		(out_index, in_index) = step
+		sum_a += pool[in_index] - pool[out_index]
+	return (count, num_splits)
+
+# takes two groups of whole numbers and returns the exact probability of getting
+# a difference of means as extreme as the observed one or more extreme
+def subsetsumprob(grpA, grpB, observed_mean_diff):
+	if [val for val in grpA + grpB if val != int(val)]:
+		raise ValueError('method "subsetsum" needs whole numbers, scale the values first')
+	pool = [int(val) for val in grpA + grpB]
+	num_picked = len(grpA)
+	limit = int(sum(grpA))
+	if observed_mean_diff < 0:
+		# as extreme means a sum of group a of at least limit,
+		# which is a sum of at most -limit for the negated values
+		pool = [-val for val in pool]
+		limit = -limit
+	# move the values so the smallest is 0, this moves every sum of group a
+	# by num_picked times the same amount
+	low = min(pool)
+	pool = [val - low for val in pool]
+	max_sum = limit - num_picked * low
+	# probs[k][s] is the probability that k values picked at random from the values
+	# seen so far add up to s (sums above max_sum only grow, we never need them)
+	probs = numpy.zeros((num_picked + 1, max_sum + 1))
+	probs[0][0] = 1.0
+	for i in range(1, len(pool) + 1):
+		val = pool[i - 1]
+		num_rows = min(i, num_picked)
+		k = numpy.arange(1, num_rows + 1).reshape(num_rows, 1)
+		# a pick of k values from the first i either leaves value i out
+		# (probability (i - k) / i) or is a pick of k - 1 values plus value i
+		new_probs = ((i - k) / float(i)) * probs[1:num_rows + 1]
+		if val <= max_sum:
+			new_probs[:, val:] += (k / float(i)) * probs[:num_rows, :max_sum + 1 - val]
+		probs[1:num_rows + 1] = new_probs
+	return float(probs[num_picked].sum())
+
 ######################################
 #
 # Computations
@@ -107,20 +431,67 @@ for line in infile:
 		samples[len(samples) - 1] += map(float,line.split())
 infile.close()
 
-observed_mean_diff = meandiff(samples[a], samples[b])
+if statistic == "mean":
+	q = None
+	stat_name = "means"
+elif statistic == "median":
+	q = 0.5
+	stat_name = "medians"
+else:
+	q = quantileof(statistic)
+	stat_name = statistic + " values"
+
+# the exact version only works for means
+if method == "auto":
+	if q is None and numsplits(len(samples[a]), len(samples[b]), exact_limit) <= exact_limit:
+		method = "exact"
+	else:
+		method = "shuffle"
+if q is not None and method not in ("shuffle", "numpy"):
+	raise ValueError('method "%s" only works for means' % method)
+observed_diff = statdiff(samples[a], samples[b], q)
 
 count = 0
 num_shuffles = 10000
 
-for i in range(num_shuffles):
-	new_samples = shuffle(samples)
-	mean_diff = meandiff(new_samples[a], new_samples[b])
-	# if the observed difference is negative, look for differences that are smaller
-	# if the observed difference is positive, look for differences that are greater
-	if observed_mean_diff < 0 and mean_diff <= observed_mean_diff:
-		count = count + 1
-	elif observed_mean_diff >= 0 and mean_diff >= observed_mean_diff:
-		count = count + 1
+if method == "subsetsum":
+	exact_prob = subsetsumprob(samples[a], samples[b], observed_diff)
+elif method == "exact":
+	(count, num_shuffles) = exactcount(samples[a], samples[b], observed_diff)
+elif method == "numpy":
+	if q is None:
+		diffs = batchedmeandiffs(samples[a], samples[b], num_shuffles, chunk_size)
+	else:
+		diffs = batchedquantilediffs(samples[a], samples[b], q, num_shuffles, chunk_size)
+	if observed_diff < 0:
+		count = int(numpy.count_nonzero(diffs <= observed_diff))
+	else:
+		count = int(numpy.count_nonzero(diffs >= observed_diff))
+elif method == "counts":
+	mean_diffs = tiedmeandiffs(samples[a], samples[b], num_shuffles, chunk_size)
+	# tied values give many shuffles the very same means as observed, only computed
+	# in a different order: differences this close to observed are ties
+	tolerance = 1e-9 * max([abs(val) for val in samples[a] + samples[b]])
+	if observed_diff < 0:
+		count = int(numpy.count_nonzero(mean_diffs <= observed_diff + tolerance))
+	else:
+		count = int(numpy.count_nonzero(mean_diffs >= observed_diff - tolerance))
+elif method == "subset":
+	for mean_diff in subsetmeandiffs(samples[a], samples[b], num_shuffles):
+		if observed_diff < 0 and mean_diff <= observed_diff:
+			count = count + 1
+		elif observed_diff >= 0 and mean_diff >= observed_diff:
+			count = count + 1
+else:
+	for i in range(num_shuffles):
+		new_samples = shuffle(samples)
+		diff = statdiff(new_samples[a], new_samples[b], q)
+		# if the observed difference is negative, look for differences that are smaller
+		# if the observed difference is positive, look for differences that are greater
+		if observed_diff < 0 and diff <= observed_diff:
+			count = count + 1
+		elif observed_diff >= 0 and diff >= observed_diff:
+			count = count + 1
 
 ######################################
 #
@@ -128,16 +499,24 @@ for i in range(num_shuffles):
 #
 ######################################
 
-print "Observed difference of two means: %.2f" % observed_mean_diff 
-print count, "out of", num_shuffles, "experiments had a difference of two means",
-if observed_mean_diff < 0:
-	print "less than or equal to",
+print "Observed difference of two %s: %.2f" % (stat_name, observed_diff)
+if method == "subsetsum":
+	print "Exact probability of getting a difference of two", stat_name,
+elif method == "exact":
+	print count, "out of all", num_shuffles, "ways to split the values had a difference of two", stat_name,
 else:
-	print "greater than or equal to",
-print "%.2f" % observed_mean_diff, "."
-print "The chance of getting a difference of two means",
-if observed_mean_diff < 0:
+	print count, "out of", num_shuffles, "experiments had a difference of two", stat_name,
+if observed_diff < 0:
 	print "less than or equal to",
 else:
 	print "greater than or equal to",
-print "%.2f" % observed_mean_diff, "is", (count / float(num_shuffles)), "."
+if method == "subsetsum":
+	print "%.2f" % observed_diff, "is", exact_prob, "."
+else:
+	print "%.2f" % observed_diff, "."
+	print "The chance of getting a difference of two", stat_name,
+	if observed_diff < 0:
+		print "less than or equal to",
+	else:
+		print "greater than or equal to",
+	print "%.2f" % observed_diff, "is", (count / float(num_shuffles)), "."
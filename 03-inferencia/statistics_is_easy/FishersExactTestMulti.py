@@ -0,0 +1,308 @@
+#!/usr/bin/python
+
+######################################
+# Multi-Variable Fisher's Exact Test - Significance Test
+#
+# Assuming that health does not influence wealth, computes the exact probability
+# of getting, by chance alone, a matrix of counts as unlikely as or more unlikely
+# than the observed one (the Freeman-Halton extension of Fisher's Exact Test to
+# matrices with any number of rows and columns).  Unlike ChiSquaredMulti.py no
+# shuffling is done: every matrix with the same row and column totals is
+# accounted for, so the answer is exact.
+#
+# Example of FASTA formatted input file (same as ChiSquaredMulti.py):
+# >sick
+# 20 18 8
+# >healthy
+# 24 24 16
+#
+# Pseudocode:
+#
+# 1. Calculate the probability of the observed matrix by chance alone
+#    (in our example it is 0.0201).  For a matrix with row totals R, column totals C
+#    and n values in total it is:
+#    prob = (product of R! * product of C!) / (n! * product of the count in each cell!)
+#
+# 2. Build the possible matrices one column at a time, left to right.  After a column is
+#    filled in, all that matters for the columns still to come is how much is left in each
+#    row, so partial matrices that leave the same amounts in the rows are kept together
+#    and the columns after them are only worked out once.  For each group of partial matrices:
+#    a. Compute the largest and the smallest probability any way of finishing them could give
+#       (see max_log_bound and min_log_bound below: these take every column still to come
+#       into account, so they get close to the true largest and smallest probability).
+#    b. If even the largest probability is less than or equal to the observed one (0.0201),
+#       every way of finishing these partial matrices counts: add the probability of all of
+#       them to our total, which can be done with a formula instead of listing them.
+#    c. If even the smallest probability is greater than the observed one, none of them count,
+#       forget about them.
+#    d. Otherwise, fill in the next column in every possible way and go back to step (2a).
+#
+# 3. The total from step (2b) is the probability of getting a matrix as unlikely as or more
+#    unlikely than the observed one, if wealth has no influence on health.
+#
+# Included in the code, but NOT in the pseudocode: partial matrices in a group whose
+# probabilities so far are equal (up to rounding) are counted together, as one
+# probability and how many partial matrices have it, and steps (2b) and (2c) are done
+# for all the partial matrices of a group at once with numpy, as soon as the next
+# column is filled in, so only those that step (2d) needs are kept.  For large matrices
+# this can still be too much work: if a column takes more than exact_limit steps (ways
+# of filling it tried, plus partial matrices kept for the next column), the exact answer
+# would take too long, and the probability is estimated instead by shuffling the values
+# num_shuffles times, as ChiSquaredMulti.py does.
+#
+######################################
+
+import math
+import numpy
+
+######################################
+#
+# Adjustable variables
+#
+######################################
+
+input_file = "chisquaredmulti.vals"
+exact_limit = 10000000	# the most steps for one column before shuffling is used
+num_shuffles = 10000	# number of shuffles when the exact test takes too many steps
+
+######################################
+#
+# Subroutines
+#
+######################################
+
+# returns an array with log(n!) for n from 0 to max_n
+def logfactorials(max_n):
+	log_factorials = numpy.zeros(max_n + 1)
+	log_factorials[1:] = numpy.cumsum(numpy.log(numpy.arange(1, max_n + 1)))
+	return log_factorials
+
+# returns every way of putting col_total values into one column, without putting
+# more in a row than what is left in that row (row_vals), one way per row of a matrix
+def column_fillings(row_vals, col_total):
+	fillings = numpy.zeros((1, 0), dtype=int)
+	# what each way still has to put in the rows after the ones filled so far
+	left = numpy.array([col_total])
+	for r in range(len(row_vals) - 1):
+		# the rows after this one can take at most this much
+		rest = sum(row_vals[r + 1:])
+		vals = numpy.arange(min(row_vals[r], col_total) + 1)
+		# every way so far, with every value for row r that leaves a possible rest
+		new_left = left[:, numpy.newaxis] - vals
+		(ways, picked) = numpy.nonzero((new_left >= 0) & (new_left <= rest))
+		fillings = numpy.column_stack((fillings[ways], vals[picked]))
+		left = new_left[ways, picked]
+	# the last row takes what is left
+	return numpy.column_stack((fillings, left))
+
+# an upper bound on -sum(log(count!)) over every way of filling the columns col_totals
+# with row_vals left in the rows.  -sum(log(count!)) is the same as charging each value
+# a column takes from a row with r left log(r), adding sum(r * log(r)) for the rows, and
+# with that charge the columns need not share the rows any more: each column on its own
+# takes the values worth the most, where the k-th value taken from a row with r left is
+# worth log(r) - log(k).  The largest of these for a column is at least what that column
+# gets in any real way of filling them all, so the sum is an upper bound.
+def max_log_bound(row_vals, col_totals):
+	gains = []
+	charge = 0.0
+	for row_val in row_vals:
+		if row_val > 0:
+			log_row = math.log(row_val)
+			charge += row_val * log_row
+			for k in range(1, row_val + 1):
+				gains.append(log_row - math.log(k))
+	gains.sort(reverse=True)
+	# best[m] is the most m values can be worth
+	best = [0.0]
+	for gain in gains:
+		best.append(best[-1] + gain)
+	total = -charge
+	for col_total in col_totals:
+		total += best[col_total]
+	return total
+
+# a lower bound on the same: each column on its own puts its values in as few rows
+# as possible, filling the rows with the most left first
+def min_log_bound(row_vals, col_totals, log_factorials):
+	total = 0.0
+	for col_total in col_totals:
+		left = col_total
+		for row_val in sorted(row_vals, reverse=True):
+			val = min(row_val, left)
+			total -= log_factorials[val]
+			left -= val
+	return total
+
+# for partial matrices with row_vals left in the rows and the columns col_totals to come
+# returns the largest and the smallest -sum(log(count!)) of the ways to finish them
+# (bounds from above, which also hold with the rows and columns swapped, so we keep
+# the closer of the two), and the log of the sum, over every way to finish them,
+# of 1 / (product of the count in each cell!)
+def finishing_bounds(row_vals, col_totals, log_factorials):
+	if len(col_totals) == 1:
+		# only one way to fill the last column
+		max_log = -log_factorials[list(row_vals)].sum()
+		min_log = max_log
+	else:
+		max_log = min(max_log_bound(row_vals, col_totals), max_log_bound(col_totals, row_vals))
+		min_log = max(min_log_bound(row_vals, col_totals, log_factorials), min_log_bound(col_totals, row_vals, log_factorials))
+	log_all = log_factorials[sum(row_vals)] - log_factorials[list(row_vals) + list(col_totals)].sum()
+	return (max_log, min_log, log_all)
+
+# values are the -sum(log(count!)) of partial matrices so far, counts how many partial
+# matrices have each value: values within tolerance of each other are kept as one
+# returns the values in increasing order, with their counts
+def mergepaths(values, counts, tolerance):
+	keys = numpy.floor(values / tolerance)
+	order = numpy.argsort(keys, kind='mergesort')
+	keys = keys[order]
+	starts = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+	return (values[order][starts], numpy.add.reduceat(counts[order], starts))
+
+# takes a matrix as a list of rows
+# returns the probability of getting this matrix by chance alone
+# and the probability of getting a matrix with a probability
+# less than or equal to it (None if a column takes more than exact_limit steps:
+# ways of filling it tried, plus partial matrices kept for the next column)
+def fishers_exact_test(matrix, exact_limit):
+	# fewer rows means fewer different amounts left in the rows
+	if len(matrix) > len(matrix[0]):
+		matrix = [list(col) for col in zip(*matrix)]
+	row_totals = [sum(row) for row in matrix]
+	col_totals = [sum(col) for col in zip(*matrix)]
+	log_factorials = logfactorials(sum(row_totals))
+
+	# every matrix with these totals has probability
+	# exp(log_const - sum(log(count!)))
+	log_const = log_factorials[row_totals + col_totals].sum() - log_factorials[sum(row_totals)]
+	log_observed = log_const - log_factorials[numpy.array(matrix)].sum()
+	# a matrix counts if its -sum(log(count!)) is at most limit
+	# (matrices this much more likely than the observed one still count as equal)
+	limit = log_observed + 1e-7 - log_const
+
+	root = tuple(sorted(row_totals))
+	(max_log, min_log, log_all) = finishing_bounds(root, col_totals, log_factorials)
+	if max_log <= limit:
+		# every matrix counts
+		return (math.exp(log_observed), 1.0)
+
+	prob_tail = 0.0
+	# partial matrices, grouped by what is left in the rows (sorted, since
+	# which row has which amount left does not matter for the columns to come)
+	# for each group we keep (values, counts) arrays of the -sum(log(count!)) so far
+	# of its partial matrices, and how many partial matrices have each value
+	groups = {root: [(numpy.zeros(1), numpy.ones(1))]}
+	for c in range(len(col_totals) - 1):
+		next_groups = {}
+		next_bounds = {}
+		num_steps = 0
+		for row_vals in groups:
+			values = numpy.concatenate([vals for (vals, counts) in groups[row_vals]])
+			counts = numpy.concatenate([counts for (vals, counts) in groups[row_vals]])
+			(values, counts) = mergepaths(values, counts, 1e-9)
+			# weights[i] is the sum of count * exp(value - top) over the i + 1 smallest
+			# values (exp(value) itself is too small for a float in large matrices)
+			top = values[-1]
+			weights = numpy.cumsum(counts * numpy.exp(values - top))
+
+			fillings = column_fillings(row_vals, col_totals[c])
+			num_steps += len(fillings)
+			log_fillings = -log_factorials[fillings].sum(axis=1)
+			next_rows = numpy.sort(numpy.array(row_vals) - fillings, axis=1)
+			# sort the fillings so that those leading to the same group come together,
+			# first is True for the first filling of each group
+			order = numpy.lexsort(next_rows.T)
+			next_rows = next_rows[order]
+			log_fillings = log_fillings[order]
+			first = numpy.concatenate(([True], (next_rows[1:] != next_rows[:-1]).any(axis=1)))
+			next_keys = map(tuple, next_rows[first].tolist())
+			for next_row_vals in next_keys:
+				if next_row_vals not in next_bounds:
+					next_bounds[next_row_vals] = finishing_bounds(next_row_vals, col_totals[c + 1:], log_factorials)
+			which = numpy.cumsum(first) - 1
+			(max_logs, min_logs, log_alls) = numpy.array([next_bounds[key] for key in next_keys]).T[:, which]
+
+			# after each filling, the values up to index low - 1 count for sure (2b),
+			# those from index high on never do (2c), and the ones in between are kept (2d)
+			low = numpy.searchsorted(values, limit - max_logs - log_fillings, side='right')
+			high = numpy.searchsorted(values, limit - min_logs - log_fillings, side='right')
+			counted = low > 0
+			prob_tail += (weights[low[counted] - 1] * numpy.exp(log_const + top + log_fillings[counted] + log_alls[counted])).sum()
+
+			# values[low:high] + log_filling for each filling, all in one array
+			num_vals = high - low
+			ends = numpy.cumsum(num_vals)
+			index = numpy.arange(ends[-1]) - numpy.repeat(ends - num_vals - low, num_vals)
+			kept_values = values[index] + numpy.repeat(log_fillings, num_vals)
+			kept_counts = counts[index]
+			num_steps += ends[-1]
+			if num_steps > exact_limit:
+				return (math.exp(log_observed), None)
+			# the kept values of each next group come one after another
+			group_ends = ends[numpy.append(numpy.flatnonzero(first[1:]), len(first) - 1)]
+			group_starts = numpy.concatenate(([0], group_ends[:-1]))
+			for g in numpy.flatnonzero(group_ends > group_starts):
+				kept = (kept_values[group_starts[g]:group_ends[g]], kept_counts[group_starts[g]:group_ends[g]])
+				next_groups.setdefault(next_keys[g], []).append(kept)
+		groups = next_groups
+	return (math.exp(log_observed), min(prob_tail, 1.0))
+
+# returns how many of num_shuffles matrices with the same row and column totals as matrix,
+# each made by shuffling which column each value is in (as ChiSquaredMulti.py does),
+# have a probability less than or equal to that of matrix
+def shuffledcount(matrix, num_shuffles):
+	num_rows = len(matrix)
+	num_cols = len(matrix[0])
+	rows = []
+	cols = []
+	for r in range(num_rows):
+		for c in range(num_cols):
+			rows += [r] * matrix[r][c]
+			cols += [c] * matrix[r][c]
+	cells = numpy.array(rows) * num_cols
+	cols = numpy.array(cols)
+	log_factorials = logfactorials(len(rows))
+	# the probability of a matrix only depends on -sum(log(count!))
+	limit = -log_factorials[numpy.array(matrix)].sum() + 1e-7
+	count = 0
+	for i in range(num_shuffles):
+		new_counts = numpy.bincount(cells + numpy.random.permutation(cols), minlength=num_rows * num_cols)
+		if -log_factorials[new_counts].sum() <= limit:
+			count = count + 1
+	return count
+
+######################################
+#
+# Computations
+#
+######################################
+
+observed = []
+
+# file must be in FASTA format
+infile=open(input_file)
+for line in infile:
+	if not line.isspace() and not line.startswith('>'):
+		# this is one row
+		observed.append(map(int,line.split()))
+infile.close()
+
+count = None
+(observed_prob, prob_tail) = fishers_exact_test(observed, exact_limit)
+if prob_tail is None:
+	# too many steps for the exact test, estimate it by shuffling
+	count = shuffledcount(observed, num_shuffles)
+	prob_tail = count / float(num_shuffles)
+
+######################################
+#
+# Output
+#
+######################################
+
+print "Probability of the observed matrix: %.4f" % observed_prob
+if count is not None:
+	print "Too many matrices for the exact test:", count, "out of", num_shuffles, "shuffles gave us a matrix",
+	print "with a probability of %.4f" % observed_prob, "or less."
+print "Probability that chance alone gave us a matrix with a probability",
+print "of %.4f" % observed_prob, "or less is", prob_tail
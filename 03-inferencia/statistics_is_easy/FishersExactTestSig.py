@@ -82,9 +82,21 @@
 # 4. counter / 10,000 equals the probability of getting a Fisher's Exact Test less than
 #    or equal to our observed probability (0.2619)
 #
+# Included in the code, but NOT in the pseudocode, is an exact version of
+# steps (2) - (4) (set method = "exact" below).  Once the row and column totals
+# are fixed there are only min(a + b, a + c, b + d, c + d) + 1 possible matrices,
+# so instead of simulating we list each of them once, compute its Fisher's Exact
+# Test and weight it by the probability of getting that matrix by chance.
+# The sum of the weights of the matrices whose Fisher's Exact Test is less than
+# or equal to the observed one is the exact answer.
+# Note that shuffle picks each count uniformly, whereas the exact version
+# weights matrices by their actual (hypergeometric) probability, so the two
+# versions do not estimate quite the same number.
+#
 ######################################
 
 import random
+import math
 
 ######################################
 #
@@ -93,6 +105,7 @@ import random
 ######################################
 
 input_file = "fishersexact.vals"
+method = "shuffle"	# "shuffle" (as in the pseudocode) or "exact" (lists every possible matrix)
 
 ######################################
 #
@@ -141,14 +154,48 @@ def shuffle(orig_row_totals, orig_column_totals):
                 current_row += 1
         return new_counts
 
-def factorial(n):
-	prod = 1
-	for i in range(n):
-		prod = prod * (i + 1)
-	return prod
+# log(n!) for each n we have needed so far
+log_factorials = {}
+
+def log_factorial(n):
+	if n not in log_factorials:
+		log_factorials[n] = math.lgamma(n + 1)
+	return log_factorials[n]
 
+# prob = ((a + b)!(c + d)!(a + c)!(b + d)! / (a!b!c!d!n!)
+# computed with logarithms, so large counts do not overflow
 def prob_of_matrix(a, b, c, d):
-	return (factorial(a + b) * factorial(c + d) * factorial(a + c) * factorial(b + d)) / float(factorial(a) * factorial(b) * factorial(c) * factorial(d) * factorial(a + b + c + d))
+	log_prob = log_factorial(a + b) + log_factorial(c + d) + log_factorial(a + c) + log_factorial(b + d)
+	log_prob -= log_factorial(a) + log_factorial(b) + log_factorial(c) + log_factorial(d) + log_factorial(a + b + c + d)
+	return math.exp(log_prob)
+
+# sums the probability of the matrix
+#   a b
+#   c d
+# and of the matrices with the same row and column totals that come after it
+# (step = 1, a grows) or before it (step = -1, a shrinks)
+# the probability of each matrix is the previous one times the ratio between
+# neighbouring matrices, so only one prob_of_matrix call is needed
+# we must be walking away from the most likely matrix: the probabilities only
+# get smaller, so we can stop as soon as they no longer change the sum
+def sum_of_probs(a, b, c, d, step):
+	prob = prob_of_matrix(a, b, c, d)
+	total = 0.0
+	while prob > 0:
+		total += prob
+		if step == 1:
+			if b == 0 or c == 0:
+				break	# this was the last possible matrix
+			prob = prob * b * c / (float(a + 1) * (d + 1))
+			(a, b, c, d) = (a + 1, b - 1, c - 1, d + 1)
+		else:
+			if a == 0 or d == 0:
+				break	# this was the first possible matrix
+			prob = prob * a * d / (float(b + 1) * (c + 1))
+			(a, b, c, d) = (a - 1, b + 1, c + 1, d - 1)
+		if prob < total * 1e-17:
+			break
+	return total
 
 def fishers_exact_test(a, b, c, d):
 	# now we have to figure out possible outcomes
@@ -160,21 +207,48 @@ def fishers_exact_test(a, b, c, d):
 	# where "more extreme" means, more correct answers than
 	# what was observed 
 	# this translates to any matrix where a + d is larger than ours
+	# a_prime + d_prime grows with a_prime, so those are the matrices with a_prime >= a
+
+	# a value of a_prime for the most likely matrix with these row and column totals
+	most_likely_a = (a + b + 1) * (a + c + 1) // (a + b + c + d + 2)
+
+	if a > most_likely_a:
+		# sum the tail itself, walking away from the most likely matrix
+		return sum_of_probs(a, b, c, d, 1)
+	if a == 0 or d == 0:
+		# every possible matrix is as extreme or more extreme than ours
+		return 1.0
+	# the tail holds the most likely matrix, so it is easier to sum the matrices
+	# that are less extreme (again walking away from the most likely one)
+	return 1.0 - sum_of_probs(a - 1, b + 1, c + 1, d - 1, -1)
 
-	prob_tail = 0.0 
-
-	for a_prime in range(a + b + c + d + 1):
-        	b_prime = a + b - a_prime
-        	if b_prime >= 0: 
-                	c_prime = a + c - a_prime
-                	if c_prime >= 0:
-                        	d_prime = c + d - c_prime
-                        	if d_prime >= 0:
-                                	# this matrix is valid
-                                	# now check if it is "more extreme" than the observed
-                                	if a_prime + d_prime >= a + d:
-                                        	prob_tail = prob_tail + prob_of_matrix(a_prime, b_prime, c_prime, d_prime)
-	return prob_tail
+# lists every matrix with the same row and column totals as
+#   a b
+#   c d
+# and returns the probability, by chance alone, of getting a matrix
+# whose fishers_exact_test is less than or equal to the observed one
+def prob_of_tail_at_most(a, b, c, d):
+	min_a_prime = max(0, a - d)
+	max_a_prime = min(a + b, a + c)
+	# probability of each possible matrix, indexed by a_prime - min_a_prime
+	probs = []
+	for a_prime in range(min_a_prime, max_a_prime + 1):
+		b_prime = a + b - a_prime
+		c_prime = a + c - a_prime
+		d_prime = c + d - c_prime
+		probs.append(prob_of_matrix(a_prime, b_prime, c_prime, d_prime))
+	# a_prime + d_prime grows with a_prime, so the matrices "as extreme or more extreme"
+	# than a given one are that one and all those after it:
+	# its fishers_exact_test is the sum of its probability and all the ones after it
+	tails = probs[:]
+	for i in range(len(tails) - 2, -1, -1):
+		tails[i] += tails[i + 1]
+	observed_tail = tails[a - min_a_prime]
+	total = 0.0
+	for i in range(len(probs)):
+		if tails[i] <= observed_tail:
+			total += probs[i]
+	return total
 
 ######################################
 #
@@ -204,11 +278,14 @@ observed_prob_tail = fishers_exact_test(a, b, c, d)
 count = 0
 num_runs = 10000
 
-for i in range(num_runs):
-        [a_prime, b_prime, c_prime, d_prime] = shuffle([a + b, c + d], [a + c, b + d])
-        prob_tail = fishers_exact_test(a_prime, b_prime, c_prime, d_prime)
-        if (prob_tail <= observed_prob_tail):
-                count = count + 1
+if method == "exact":
+        exact_prob = prob_of_tail_at_most(a, b, c, d)
+else:
+        for i in range(num_runs):
+                [a_prime, b_prime, c_prime, d_prime] = shuffle([a + b, c + d], [a + c, b + d])
+                prob_tail = fishers_exact_test(a_prime, b_prime, c_prime, d_prime)
+                if (prob_tail <= observed_prob_tail):
+                        count = count + 1
 
 ######################################
 #
@@ -217,6 +294,10 @@ for i in range(num_runs):
 ######################################
 
 print "Observed Fisher's Exact Test: %.4f" % observed_prob_tail
-print count, "out of 10000 experiments had a Fisher's Exact Test less than or equal to %.4f" % observed_prob_tail
-print "Probability that chance alone gave us a Fisher's Exact Test",
-print "of %.4f" % observed_prob_tail, "or less is", (count / float(num_runs))
+if method == "exact":
+	print "Exact probability that chance alone gave us a Fisher's Exact Test",
+	print "of %.4f" % observed_prob_tail, "or less is", exact_prob
+else:
+	print count, "out of 10000 experiments had a Fisher's Exact Test less than or equal to %.4f" % observed_prob_tail
+	print "Probability that chance alone gave us a Fisher's Exact Test",
+	print "of %.4f" % observed_prob_tail, "or less is", (count / float(num_runs))
@@ -69,11 +69,21 @@
 #
 # 6. The bootstrap values at the lower bound and upper bound give us our confidence interval.
 #
+# Also included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (2) (set method = "numpy" below).  The f-statistic of a set of
+# groups only depends on the count, the sum and the sum of squares of each group.
+# For each group we draw a matrix of resample counts (one row per bootstrap,
+# one column per original value: how many times that value was picked), and one
+# matrix product with the values and their squares gives us the sum and the
+# sum of squares of every bootstrap sample of that group.
+#
 ###################################### 
 
 import random
 import math
 import sys
+import numpy
+from resampling import normaldist
 
 ######################################
 #
@@ -82,6 +92,9 @@ import sys
 ######################################
 
 input_file = 'OneWayAnova.vals'
+method = "bootstrap"	# "bootstrap" (as in the pseudocode) or "numpy" (batched)
+chunk_size = 100	# number of bootstraps drawn at once when method is "numpy",
+			# lower it for very large samples (it uses chunk_size * len(sample) counts)
 
 ######################################
 #
@@ -89,37 +102,6 @@ input_file = 'OneWayAnova.vals'
 #
 ######################################
 
-# maps proportion of values above statistic
-# to number of standard deviations above statistic
-# keys will be index / 100 \:[0-9]\.[0-9][0-9]\,
-area_to_sd_map = [0.0000, 0.0040, 0.0080, 0.0120, 0.0160, 0.0199, 0.0239, 0.0279, 0.0319, 0.0359, 0.0398, 0.0438, 0.0478, 0.0517, 0.0557, 0.0596, 0.0636, 0.0675, 0.0714, 0.0753, 0.0793, 0.0832, 0.0871, 0.0910, 0.0948, 0.0987, 0.1026, 0.1064, 0.1103, 0.1141, 0.1179, 0.1217, 0.1255, 0.1293, 0.1331, 0.1368, 0.1406, 0.1443, 0.1480, 0.1517, 0.1554, 0.1591, 0.1628, 0.1664, 0.1700, 0.1736, 0.1772, 0.1808, 0.1844, 0.1879, 0.1915, 0.1950, 0.1985, 0.2019, 0.2054, 0.2088, 0.2123, 0.2157, 0.2190, 0.2224, 0.2257, 0.2291, 0.2324, 0.2357, 0.2389, 0.2422, 0.2454, 0.2486, 0.2517, 0.2549, 0.2580, 0.2611, 0.2642, 0.2673, 0.2704, 0.2734, 0.2764, 0.2794, 0.2823, 0.2852, 0.2881, 0.2910, 0.2939, 0.2967, 0.2995, 0.3023, 0.3051, 0.3078, 0.3106, 0.3133, 0.3159, 0.3186, 0.3212, 0.3238, 0.3264, 0.3289, 0.3315, 0.3340, 0.3365, 0.3389, 0.3413, 0.3438, 0.3461, 0.3485, 0.3508, 0.3531, 0.3554, 0.3577, 0.3599, 0.3621, 0.3643, 0.3665, 0.3686, 0.3708, 0.3729, 0.3749, 0.3770, 0.3790, 0.3810, 0.3830, 0.3849, 0.3869, 0.3888, 0.3907, 0.3925, 0.3944, 0.3962, 0.3980, 0.3997, 0.4015, 0.4032, 0.4049, 0.4066, 0.4082, 0.4099, 0.4115, 0.4131, 0.4147, 0.4162, 0.4177, 0.4192, 0.4207, 0.4222, 0.4236, 0.4251, 0.4265, 0.4279, 0.4292, 0.4306, 0.4319, 0.4332, 0.4345, 0.4357, 0.4370, 0.4382, 0.4394, 0.4406, 0.4418, 0.4429, 0.4441, 0.4452, 0.4463, 0.4474, 0.4484, 0.4495, 0.4505, 0.4515, 0.4525, 0.4535, 0.4545, 0.4554, 0.4564, 0.4573, 0.4582, 0.4591, 0.4599, 0.4608, 0.4616, 0.4625, 0.4633, 0.4641, 0.4649, 0.4656, 0.4664, 0.4671, 0.4678, 0.4686, 0.4693, 0.4699, 0.4706, 0.4713, 0.4719, 0.4726, 0.4732, 0.4738, 0.4744, 0.4750, 0.4756, 0.4761, 0.4767, 0.4772, 0.4778, 0.4783, 0.4788, 0.4793, 0.4798, 0.4803, 0.4808, 0.4812, 0.4817, 0.4821, 0.4826, 0.4830, 0.4834, 0.4838, 0.4842, 0.4846, 0.4850, 0.4854, 0.4857, 0.4861, 0.4864, 0.4868, 0.4871, 0.4875, 0.4878, 0.4881, 0.4884, 0.4887, 0.4890, 0.4893, 0.4896, 0.4898, 0.4901, 0.4904, 0.4906, 0.4909, 0.4911, 0.4913, 0.4916, 0.4918, 0.4920, 0.4922, 0.4925, 0.4927, 0.4929, 0.4931, 0.4932, 0.4934, 0.4936, 0.4938, 0.4940, 0.4941, 0.4943, 0.4945, 0.4946, 0.4948, 0.4949, 0.4951, 0.4952, 0.4953, 0.4955, 0.4956, 0.4957, 0.4959, 0.4960, 0.4961, 0.4962, 0.4963, 0.4964, 0.4965, 0.4966, 0.4967, 0.4968, 0.4969, 0.4970, 0.4971, 0.4972, 0.4973, 0.4974, 0.4974, 0.4975, 0.4976, 0.4977, 0.4977, 0.4978, 0.4979, 0.4979, 0.4980, 0.4981, 0.4981, 0.4982, 0.4982, 0.4983, 0.4984, 0.4984, 0.4985, 0.4985, 0.4986, 0.4986, 0.4987, 0.4987, 0.4987, 0.4988, 0.4988, 0.4989, 0.4989, 0.4989, 0.4990, 0.4990]
-
-def sd_to_area(sd):
-	sign = 1
-	if sd < 0:
-		sign = -1
-	sd = math.fabs(sd)  # get the absolute value of sd
-	index = int(sd * 100)
-	if len(area_to_sd_map) <= index:
-		return sign * area_to_sd_map[-1] # return last element in array
-	if index == (sd * 100):
-		return sign * area_to_sd_map[index]
-	return sign * (area_to_sd_map[index] + area_to_sd_map[index + 1]) / 2
-
-def area_to_sd(area):
-	sign = 1
-	if area < 0:
-		sign = -1
-	area = math.fabs(area)
-	for a in range(len(area_to_sd_map)):
-		if area == area_to_sd_map[a]:
-			return sign * a / 100
-		if 0 < a and area_to_sd_map[a - 1] < area and area < area_to_sd_map[a]:
-			# our area is between this value and the previous
-			# for simplicity, we will just take the sd half way between a - 1 and a
-			return sign * (a - .5) / 100
-	return sign * (len(area_to_sd_map) - 1) / 100
-
 def bootstrap(x):
         samp_x = []
         for i in range(len(x)):
@@ -217,6 +199,46 @@ def onewayanova(grps):
 
 	return f_stat
 
+# returns a num_rows x n matrix, each row holds the number of times
+# each of the n original values was picked in one bootstrap sample
+def bootstrapcounts(n, num_rows):
+	index = numpy.random.randint(0, n, size=(num_rows, n))
+	# shift each row's indexes so every row counts into its own n bins
+	index += numpy.arange(num_rows)[:, numpy.newaxis] * n
+	return numpy.bincount(index.ravel(), minlength=num_rows * n).reshape(num_rows, n)
+
+# same as calling onewayanova on num_resamples bootstraps of each group in grps,
+# but computed chunk_size bootstraps at a time with numpy,
+# from the count, sum and sum of squares of each group
+# returns an array with the f-statistic of each bootstrap
+def batchedonewayanovas(grps, num_resamples, chunk_size):
+	pool = []
+	for grp in grps:
+		pool.extend(grp)
+	# the f-statistic does not change if we move all values by the same amount,
+	# centering them keeps the sums of squares below from losing precision
+	center = sum(pool) / float(len(pool))
+	total_count = len(pool)
+	grp_counts = numpy.array([len(grp) for grp in grps], dtype=float)
+	between_df = len(grps) - 1
+	within_df = total_count - len(grps)
+	f_stats = numpy.empty(num_resamples)
+	for start in range(0, num_resamples, chunk_size):
+		num_rows = min(chunk_size, num_resamples - start)
+		grp_sums = numpy.empty((num_rows, len(grps)))
+		within_ss = numpy.zeros(num_rows)
+		for g in range(len(grps)):
+			vals = numpy.array(grps[g], dtype=float) - center
+			# one column with the values, one with their squares
+			features = numpy.column_stack((vals, vals**2))
+			sums = bootstrapcounts(len(vals), num_rows).dot(features)
+			grp_sums[:, g] = sums[:, 0]
+			within_ss += sums[:, 1] - sums[:, 0]**2 / grp_counts[g]
+		total_sum = grp_sums.sum(axis=1)
+		between_ss = ((grp_sums**2) / grp_counts).sum(axis=1) - total_sum**2 / total_count
+		f_stats[start:start + num_rows] = (between_ss / between_df) / (within_ss / within_df)
+	return f_stats
+
 ######################################
 #
 # Computations
@@ -243,18 +265,22 @@ num_resamples = 10000   # number of times we will resample from our original sam
 num_below_observed = 0   # count the number of bootstrap values below the observed sample statistic
 out = []                # will store results of each time we resample
 
-for i in range(num_resamples):
-	# get bootstrap samples for each of our groups
-	# then compute our statistic of interest
-	# append statistic to out
-	bootstrap_samples = []  # list of lists
-	for sample in samples:
-		bootstrap_samples.append(bootstrap(sample))
-	# now we have a list of new samples, run onewayanova
-	boot_f_statistic = onewayanova(bootstrap_samples)
-	if boot_f_statistic < observed_f_statistic:
-		num_below_observed += 1
-	out.append(boot_f_statistic)
+if method == "numpy":
+	out = batchedonewayanovas(samples, num_resamples, chunk_size)
+	num_below_observed = int(numpy.count_nonzero(out < observed_f_statistic))
+else:
+	for i in range(num_resamples):
+		# get bootstrap samples for each of our groups
+		# then compute our statistic of interest
+		# append statistic to out
+		bootstrap_samples = []  # list of lists
+		for sample in samples:
+			bootstrap_samples.append(bootstrap(sample))
+		# now we have a list of new samples, run onewayanova
+		boot_f_statistic = onewayanova(bootstrap_samples)
+		if boot_f_statistic < observed_f_statistic:
+			num_below_observed += 1
+		out.append(boot_f_statistic)
 
 out.sort()
 
@@ -269,21 +295,7 @@ lower_bound = int(math.ceil(num_resamples * tails))
 upper_bound = int(math.floor(num_resamples * (1 - tails)))
 
 # bias-corrected confidence interval computations
-p = num_below_observed / float(num_resamples)	# proportion of bootstrap values below the observed value
-
-dist_from_center = p - .5	# if this is negative, the original is below the center, if positive, it is above
-z_0 = area_to_sd(dist_from_center)
-
-# now we want to find the proportion that should be between the mean and one of the tails
-tail_sds = area_to_sd(conf_interval / 2) 
-z_alpha_over_2 = 0 - tail_sds
-z_1_minus_alpha_over_2 = tail_sds
-
-# in case our lower and upper bounds are not integers,
-# we decrease the range (the values we include in our interval),
-# so that we can keep the same level of confidence
-bias_corr_lower_bound = int(math.ceil(num_resamples * (0.5 + sd_to_area(z_alpha_over_2 + (2 * z_0)))))
-bias_corr_upper_bound =  int(math.floor(num_resamples * (0.5 + sd_to_area(z_1_minus_alpha_over_2 + (2 * z_0)))))
+(bias_corr_lower_bound, bias_corr_upper_bound) = normaldist.biascorrectedbounds(num_below_observed, num_resamples, conf_interval)
 
 ######################################
 #
@@ -59,9 +59,34 @@
 # 3. counter / 10,000 equals the probability of getting a f-statistic greater than or equal to
 #    11.27, assuming there is no difference between the groups
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (3) (set method = "numpy" below).  Shuffling never changes the
+# pooled values, so the total sum of squares is the same for every shuffle,
+# and the within sum of squares is just the total minus the between sum of squares.
+# The between sum of squares only needs the sum of each group:
+# sum over groups of (group sum)^2 / group count - (total sum)^2 / total count.
+# So for each shuffle we only add up the values in each group, chunk_size
+# shuffles at a time.
+#
+# When the values have many ties (star ratings, coarse latency buckets) there is
+# method = "counts": the pool is kept as each distinct value and how many times it
+# appears, and a shuffle only draws how many copies of each value go to each group
+# (hypergeometric draws, chunk_size shuffles at a time with numpy).  A shuffle then
+# costs one draw per distinct value and group, however many values there are.
+#
+# Also included is an exact version (method = "exact").  With method = "auto" it is
+# used when there are at most exact_limit ways to split the pooled values into groups
+# of the observed sizes (for our example 22! / (7! 7! 8!), about 1.1 billion, too many),
+# and "shuffle" is used otherwise; any other method is always used as given.
+# Instead of shuffling, it tries every one of these splits once, so counter /
+# number of splits is the exact probability.  The members of each group are
+# chosen in "revolving door" order, where each choice differs from the one
+# before by one value, so the group sum only needs one add and one subtract.
+#
 ######################################
 
 import random
+import numpy
 
 ######################################
 #
@@ -70,6 +95,10 @@ import random
 ######################################
 
 input_file = 'OneWayAnova.vals'
+method = "auto"	# "shuffle" (as in the pseudocode), "numpy" (batched), "counts", "exact",
+			# or "auto" ("exact" if there are few splits, else "shuffle")
+chunk_size = 1000	# number of shuffles drawn at once when method is "numpy" or "counts"
+exact_limit = 100000	# method "auto" is "exact" if there are at most this many splits
 
 ######################################
 #
@@ -189,6 +218,204 @@ def onewayanova(grps):
 
 	return f_stat
 
+# same as calling onewayanova on num_shuffles results of shuffle(grps),
+# but computed chunk_size shuffles at a time with numpy, from the group sums alone
+# returns an array with the f-statistic of each shuffle
+def batchedonewayanovas(grps, num_shuffles, chunk_size):
+	pool = []
+	for grp in grps:
+		pool.extend(grp)
+	pool = numpy.array(pool, dtype=float)
+	# the f-statistic does not change if we move all values by the same amount,
+	# centering them keeps the sums of squares below from losing precision
+	pool -= pool.mean()
+	total_count = len(pool)
+	grp_counts = numpy.array([len(grp) for grp in grps], dtype=float)
+	# where each group starts in a shuffled pool
+	grp_starts = numpy.cumsum([0] + [len(grp) for grp in grps[:-1]])
+	# the same for every shuffle (the centered total sum is 0)
+	total_ss = (pool**2).sum()
+	between_df = len(grps) - 1
+	within_df = total_count - len(grps)
+	f_stats = numpy.empty(num_shuffles)
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		# one shuffled pool per row
+		order = numpy.argsort(numpy.random.random_sample((num_rows, total_count)), axis=1)
+		grp_sums = numpy.add.reduceat(pool[order], grp_starts, axis=1)
+		between_ss = ((grp_sums**2) / grp_counts).sum(axis=1)
+		within_ss = total_ss - between_ss
+		f_stats[start:start + num_rows] = (between_ss / between_df) / (within_ss / within_df)
+	return f_stats
+
+# same as batchedonewayanovas, but with the pool kept as (value, count) pairs:
+# each shuffle draws how many copies of each value go to each group
+# returns an array with the f-statistic of each shuffle
+def tiedonewayanovas(grps, num_shuffles, chunk_size):
+	pool = []
+	for grp in grps:
+		pool.extend(grp)
+	pool = numpy.array(pool, dtype=float)
+	pool -= pool.mean()
+	(values, value_counts) = numpy.unique(pool, return_counts=True)
+	total_count = len(pool)
+	grp_counts = numpy.array([len(grp) for grp in grps], dtype=float)
+	total_ss = (pool**2).sum()
+	between_df = len(grps) - 1
+	within_df = total_count - len(grps)
+	f_stats = numpy.empty(num_shuffles)
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		grp_sums = numpy.zeros((num_rows, len(grps)))
+		# places in each group not filled yet, in each shuffle
+		left_in_grps = numpy.empty((num_rows, len(grps)), dtype=int)
+		left_in_grps[:] = grp_counts
+		for i in range(len(values)):
+			# copies of this value still to be placed, in each shuffle
+			copies_left = numpy.empty(num_rows, dtype=int)
+			copies_left[:] = value_counts[i]
+			# places left in this group and the groups after it
+			left_in_later_grps = left_in_grps.sum(axis=1)
+			for g in range(len(grps)):
+				left_in_later_grps -= left_in_grps[:, g]
+				if g == len(grps) - 1:
+					copies = copies_left
+				else:
+					# the copies fill the places left at random, so the number that
+					# lands in this group is hypergeometric
+					# (numpy does not take a sample of 0, those shuffles get 0 copies)
+					empty = copies_left == 0
+					copies = numpy.random.hypergeometric(numpy.where(empty, 1, left_in_grps[:, g]),
+						left_in_later_grps, numpy.where(empty, 1, copies_left))
+					copies[empty] = 0
+				grp_sums[:, g] += copies * values[i]
+				left_in_grps[:, g] -= copies
+				copies_left = copies_left - copies
+		between_ss = ((grp_sums**2) / grp_counts).sum(axis=1)
+		within_ss = total_ss - between_ss
+		f_stats[start:start + num_rows] = (between_ss / between_df) / (within_ss / within_df)
+	return f_stats
+
+# number of different ways to split the values into groups of sizes counts
+# stops counting as soon as there are more than limit (and returns a number above limit)
+def numsplits(counts, limit):
+	total = 1
+	left = sum(counts)
+	for count in counts:
+		# choose the members of this group from the values left:
+		# C(left, k) = (left - k + 1) / 1 * (left - k + 2) / 2 * ... * left / k
+		k = min(count, left - count)
+		for i in range(1, k + 1):
+			total = total * (left - k + i) // i
+			if total > limit:
+				return total
+		left -= count
+	return total
+
+# walks through every way of choosing t of the positions 0 .. n - 1 in revolving
+# door order (Knuth, The Art of Computer Programming 7.2.1.3, Algorithm R): the
+# first choice is 0 .. t - 1, and each next one swaps one position out and one in
+# yields (out, in) for each step
+def revolvingdoor(n, t):
+	if t == 0 or t == n:
+		return
+	if t == 1:
+		# the algorithm needs t > 1, one position just walks along
+		for i in range(n - 1):
+			yield (i, i + 1)
+		return
+	# c[1] < c[2] < ... < c[t] are the chosen positions, c[t + 1] = n is a sentinel
+	c = [None] + range(t) + [n]
+	while True:
+		if t % 2 == 1:
+			if c[1] + 1 < c[2]:
+				yield (c[1], c[1] + 1)
+				c[1] += 1
+				continue
+			j = 2
+			decrease = True
+		else:
+			if c[1] > 0:
+				yield (c[1], c[1] - 1)
+				c[1] -= 1
+				continue
+			j = 2
+			decrease = False
+		while True:
+			if decrease:
+				# try to decrease c[j]
+				if c[j] >= j:
+					yield (c[j], j - 2)
+					(c[j], c[j - 1]) = (c[j - 1], j - 2)
+					break
+				j += 1
+			else:
+				# try to increase c[j]
+				if c[j] + 1 < c[j + 1]:
+					yield (c[j - 1], c[j] + 1)
+					(c[j - 1], c[j]) = (c[j], c[j] + 1)
+					break
+				j += 1
+				if j > t:
+					return
+			decrease = not decrease
+
+# yields a list with the sum of each group, for every way of
+# splitting vals into groups of sizes counts
+def splitsums(vals, counts):
+	if len(counts) == 1:
+		yield [sum(vals)]
+		return
+	total = sum(vals)
+	# the first choice for the first group is the first counts[0] values
+	in_first = [True] * counts[0] + [False] * (len(vals) - counts[0])
+	first_sum = sum(vals[:counts[0]])
+	steps = revolvingdoor(len(vals), counts[0])
+	while True:
+		if len(counts) == 2:
+			# the other group gets the rest
+			yield [first_sum, total - first_sum]
+		else:
+			rest = [vals[i] for i in range(len(vals)) if not in_first[i]]
+			for rest_sums in splitsums(rest, counts[1:]):
+				yield [first_sum] + rest_sums
+		step = next(steps, None)
+		if step is None:
+			break
+		(out_index, in_index) = step
+		in_first[out_index] = False
+		in_first[in_index] = True
+		first_sum += vals[in_index] - vals[out_index]
+
+# tries every way of splitting the values of grps into groups of the same sizes
+# returns the number of splits with a f-statistic greater than or equal to
+# the observed one, and the number of splits
+def exactcount(grps, observed_f_statistic):
+	pool = []
+	for grp in grps:
+		pool.extend(grp)
+	# center the values, as in batchedonewayanovas
+	total_mean = sum(pool) / len(pool)
+	pool = [val - total_mean for val in pool]
+	grp_counts = [len(grp) for grp in grps]
+	# the same for every split (the centered total sum is 0)
+	total_ss = sum([val**2 for val in pool])
+	between_df = len(grps) - 1
+	within_df = len(pool) - len(grps)
+	count = 0
+	num_splits = 0
+	for grp_sums in splitsums(pool, grp_counts):
+		between_ss = 0.0
+		for i in range(len(grps)):
+			between_ss += grp_sums[i]**2 / grp_counts[i]
+		within_ss = total_ss - between_ss
+		f_statistic = (between_ss / between_df) / (within_ss / within_df)
+		# splits this close to observed are ties, the difference is rounding
+		if f_statistic >= observed_f_statistic * (1 - 1e-9):
+			count = count + 1
+		num_splits = num_splits + 1
+	return (count, num_splits)
+
 ######################################
 #
 # Computations
@@ -214,11 +441,30 @@ observed_f_statistic = onewayanova(samples)
 count = 0
 num_shuffles = 10000
 
-for i in range(num_shuffles):
-	new_samples = shuffle(samples)
-	f_statistic = onewayanova(new_samples)
-	if (f_statistic >= observed_f_statistic):
-		count = count + 1
+if method == "auto":
+	if numsplits([len(grp) for grp in samples], exact_limit) <= exact_limit:
+		method = "exact"
+	else:
+		method = "shuffle"
+
+if method == "exact":
+	(count, num_shuffles) = exactcount(samples, observed_f_statistic)
+elif method == "numpy":
+	f_statistics = batchedonewayanovas(samples, num_shuffles, chunk_size)
+	# the f-statistics are computed from the group sums, added up in a different order
+	# than onewayanova: f-statistics this close to observed are ties
+	count = int(numpy.count_nonzero(f_statistics >= observed_f_statistic * (1 - 1e-9)))
+elif method == "counts":
+	f_statistics = tiedonewayanovas(samples, num_shuffles, chunk_size)
+	# tied values give many shuffles the very same groups sums as observed, only
+	# computed in a different order: f-statistics this close to observed are ties
+	count = int(numpy.count_nonzero(f_statistics >= observed_f_statistic * (1 - 1e-9)))
+else:
+	for i in range(num_shuffles):
+		new_samples = shuffle(samples)
+		f_statistic = onewayanova(new_samples)
+		if (f_statistic >= observed_f_statistic):
+			count = count + 1
 
 ######################################
 #
@@ -227,6 +473,9 @@ for i in range(num_shuffles):
 ######################################
 
 print "Observed F-statistic: %.2f" % observed_f_statistic 
-print count, "out of 10000 experiments had a F-statistic greater than or equal to %.2f" % observed_f_statistic
+if method == "exact":
+	print count, "out of all", num_shuffles, "ways to split the values had a F-statistic greater than or equal to %.2f" % observed_f_statistic
+else:
+	print count, "out of", num_shuffles, "experiments had a F-statistic greater than or equal to %.2f" % observed_f_statistic
 print "Probability that chance alone gave us a F-statistic", 
 print "of %.2f or more" % observed_f_statistic, "is", (count / float(num_shuffles))
@@ -0,0 +1,218 @@
+#!/usr/bin/python
+
+######################################
+# Paired Difference Significance Test
+# In the style of: Statistics is Easy! By Dennis Shasha and Manda Wilson
+#
+# Assuming that there is no difference between the two measurements of each pair
+# (before and after a change, say), tests to see the probability of getting a mean
+# difference greater than or equal to the observed one by chance alone.  Unlike
+# Diff2MeanSig.py, the values are not shuffled between the groups: each value stays
+# with its pair, and chance alone can only swap the two values of a pair, which
+# flips the sign of the difference of that pair.
+#
+# Example of FASTA formatted input file (2 groups of the same size,
+# the values in the same position form a pair):
+# >before
+# 812 790 845 802 930 765 880 798 851 822 760 905
+# >after
+# 795 781 836 810 884 760 851 790 829 815 748 872
+#
+# Pseudocode:
+#
+# 1. Subtract the value before from the value after, for each pair, and measure the
+#    mean of these differences.  In our example the mean difference is -15.75.
+#
+# 2. Set a counter to 0, this will count the number of times we get a mean
+#    difference less than or equal to -15.75.
+#
+# 3. Do the following 10,000 times:
+#    a. For each pair, flip a coin: on heads change the sign of the difference.
+#    b. Measure the mean of the differences from step (3a).
+#    c. If the mean from step (3b) is less than or equal to -15.75, increment our counter
+#       from step (2).  Note: if our original mean difference were a positive value
+#       we would check for values greater than or equal to that value.
+#
+# 4. counter / 10,000 equals the probability of getting our observed mean difference
+#    less than or equal to -15.75, if there is in fact no difference.
+#
+# Included in the code, but NOT in the pseudocode, are two other versions of step (3)
+# (set method below).  With method = "numpy" the coin flips for chunk_size experiments
+# are drawn at once, as a matrix of +1 and -1 with one row per experiment, and one
+# matrix-vector product gives the sum of the differences for all of them.
+#
+# With method = "exact" (or "auto", the default, when there are at most exact_limit
+# pairs; otherwise "auto" is "numpy") every one of the 2^n ways to flip the signs of
+# the n differences is tried once, so counter / 2^n is the exact probability.  The
+# pairs are split in two halves, and for each half the sum of its differences is
+# computed for every way of flipping their signs, in Gray code order: each way differs
+# from the one before in the sign of one difference, so its sum only needs one add.
+# A way of flipping all n signs is a way for each half, and its sum is the sum of the
+# two halves' sums; with the second half's sums sorted, a binary search tells how many
+# of them are large enough for each sum of the first half.  So 30 pairs take
+# 2 * 2^15 sums and no 2^30 loop.
+#
+######################################
+
+import random
+import numpy
+
+######################################
+#
+# Adjustable variables
+#
+######################################
+
+input_file = "Paired.vals"
+method = "auto"	# "flip" (as in the pseudocode), "numpy" (batched), "exact",
+			# or "auto" ("exact" if there are few pairs, else "numpy")
+chunk_size = 1000	# number of experiments drawn at once when method is "numpy"
+exact_limit = 30	# method "auto" is "exact" if there are at most this many pairs
+
+######################################
+#
+# Subroutines
+#
+######################################
+
+def mean(vals):
+	return sum(vals) / float(len(vals))
+
+# changes the sign of each value with probability 1/2
+def flipsigns(vals):
+	new_vals = []
+	for val in vals:
+		if random.randint(0, 1) == 1:
+			new_vals.append(-val)
+		else:
+			new_vals.append(val)
+	return new_vals
+
+# same as calling mean on num_experiments results of flipsigns(diffs),
+# but computed chunk_size experiments at a time with numpy
+# returns an array with the mean difference of each experiment
+def batchedmeans(diffs, num_experiments, chunk_size):
+	diffs = numpy.array(diffs, dtype=float)
+	means = numpy.empty(num_experiments)
+	for start in range(0, num_experiments, chunk_size):
+		num_rows = min(chunk_size, num_experiments - start)
+		# one row of +1 and -1 per experiment
+		signs = 2 * numpy.random.randint(0, 2, size=(num_rows, len(diffs))) - 1
+		means[start:start + num_rows] = signs.dot(diffs) / len(diffs)
+	return means
+
+# returns a list with the sum of vals for every way of flipping their signs
+# the ways are visited in Gray code order: the i-th way flips the sign of the value
+# at the lowest bit set in i, and bit k of signs is set if value k is negated
+def flippedsums(vals):
+	total = sum(vals)
+	signs = 0
+	sums = [total]
+	for i in range(1, 2**len(vals)):
+		# the lowest bit set in i
+		k = (i & -i).bit_length() - 1
+		if signs & (1 << k):
+			total += 2 * vals[k]
+		else:
+			total -= 2 * vals[k]
+		signs ^= 1 << k
+		sums.append(total)
+	return sums
+
+# tries every way of flipping the signs of diffs
+# returns the number of ways with a sum as extreme as the observed one or more extreme,
+# and the number of ways
+def exactcount(diffs):
+	observed_sum = sum(diffs)
+	half = len(diffs) // 2
+	first_sums = numpy.array(flippedsums(diffs[:half]))
+	second_sums = numpy.sort(flippedsums(diffs[half:]))
+	# the sums are added up in a different order than observed_sum,
+	# sums this close to it are ties
+	tolerance = 1e-9 * sum([abs(diff) for diff in diffs])
+	if observed_sum < 0:
+		# for each first half sum, the second half sums with
+		# first + second <= observed, that is second <= observed - first
+		count = numpy.searchsorted(second_sums, observed_sum - first_sums + tolerance, side='right').sum()
+	else:
+		# second >= observed - first
+		count = (len(second_sums) - numpy.searchsorted(second_sums, observed_sum - first_sums - tolerance, side='left')).sum()
+	return (int(count), len(first_sums) * len(second_sums))
+
+######################################
+#
+# Computations
+#
+######################################
+
+# list of lists
+samples = []
+a = 0
+b = 1
+
+# file must be in FASTA format
+infile=open(input_file)
+for line in infile:
+	if line.startswith('>'):
+		# start of new sample
+		samples.append([])
+	elif not line.isspace():
+		# line must contain values for previous sample
+		samples[len(samples) - 1] += map(float,line.split())
+infile.close()
+
+diffs = [samples[b][i] - samples[a][i] for i in range(len(samples[a]))]
+observed_mean_diff = mean(diffs)
+
+count = 0
+num_experiments = 10000
+
+if method == "auto":
+	if len(diffs) <= exact_limit:
+		method = "exact"
+	else:
+		method = "numpy"
+
+if method == "exact":
+	(count, num_experiments) = exactcount(diffs)
+elif method == "numpy":
+	mean_diffs = batchedmeans(diffs, num_experiments, chunk_size)
+	# the means are added up in a different order than observed_mean_diff,
+	# means this close to it are ties
+	tolerance = 1e-9 * max([abs(diff) for diff in diffs])
+	if observed_mean_diff < 0:
+		count = int(numpy.count_nonzero(mean_diffs <= observed_mean_diff + tolerance))
+	else:
+		count = int(numpy.count_nonzero(mean_diffs >= observed_mean_diff - tolerance))
+else:
+	for i in range(num_experiments):
+		mean_diff = mean(flipsigns(diffs))
+		# if the observed difference is negative, look for differences that are smaller
+		# if the observed difference is positive, look for differences that are greater
+		if observed_mean_diff < 0 and mean_diff <= observed_mean_diff:
+			count = count + 1
+		elif observed_mean_diff >= 0 and mean_diff >= observed_mean_diff:
+			count = count + 1
+
+######################################
+#
+# Output
+#
+######################################
+
+print "Observed mean difference: %.2f" % observed_mean_diff
+if method == "exact":
+	print count, "out of all", num_experiments, "ways to flip the signs had a mean difference",
+else:
+	print count, "out of", num_experiments, "experiments had a mean difference",
+if observed_mean_diff < 0:
+	print "less than or equal to",
+else:
+	print "greater than or equal to",
+print "%.2f" % observed_mean_diff, "."
+print "The chance of getting a mean difference",
+if observed_mean_diff < 0:
+	print "less than or equal to",
+else:
+	print "greater than or equal to",
+print "%.2f" % observed_mean_diff, "is", (count / float(num_experiments)), "."
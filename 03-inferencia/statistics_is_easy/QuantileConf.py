@@ -0,0 +1,185 @@
+#!/usr/bin/python
+
+######################################
+# Quantile Confidence Interval
+# In the style of: Statistics is Easy! By Dennis Shasha and Manda Wilson
+#
+# Gets an exact 90% confidence interval for the median (or another quantile, such as
+# the 99th percentile) from the values of the sample themselves, with no bootstrapping.
+# The only assumption is that the values are independent draws from one distribution.
+#
+# Example of FASTA formatted input file:
+# >slides
+# 60.2 63.1 58.4 58.9 61.2 67.0 61.0 59.7 58.2 59.8
+#
+# Pseudocode:
+#
+# 1. Measure the median.  Sorted, our example is 58.2 58.4 58.9 59.7 59.8 60.2 61.0 61.2 63.1 67.0,
+#    and the median is halfway between 59.8 and 60.2, 60.00.
+#
+# 2. Each value of the sample is below the true median with probability 0.5 (below the true
+#    99th percentile with probability 0.99), whatever the distribution.  So the number of values
+#    below it is like the number of heads in 10 tosses of a coin with that probability, and
+#    we know the chance of each number, from 0 to 10.
+#
+# 3. Compute the size of each interval tail.  If we want a 90% confidence interval, then 1 - 0.9 yields the
+#    portion of the interval in the tails.  We divide this by 2 to get the size of each tail, in this case 0.05.
+#
+# 4. The true median is below the k-th smallest value only if fewer than k values are below it.
+#    Take the largest k for which the chance of that is at most 0.05: the chance of fewer than 2
+#    heads in 10 tosses is 11 / 1024 = 0.011, the chance of fewer than 3 is 56 / 1024 = 0.055,
+#    so the lower bound is the 2nd smallest value, 58.4.
+#
+# 5. In the same way the true median is above the u-th smallest value only if at least u values
+#    are below it.  Take the smallest u for which the chance of that is at most 0.05: u = 9,
+#    and the upper bound is the 9th smallest value, 63.1.
+#
+# 6. The true median is between these two values unless one of the two unlikely things above
+#    happened, so our confidence is 1 - 0.011 - 0.011 = 0.979, at least the 90% we asked for.
+#    (If even the smallest value is not low enough, there is no lower bound at this
+#    confidence: the sample is too small for it; the same for the upper bound.)
+#
+# Included in the code, but NOT in the pseudocode, is how the values are found.
+# We never sort the sample: we only need the values at a few positions of the sorted
+# order (the bounds and the one or two values of step (1)), and select() finds each of
+# them by quickselect, in time proportional to the size of the sample.  With the chances
+# of step (2) computed once, the interval takes a few passes over the values instead of
+# 10,000 bootstrap samples.
+#
+######################################
+
+import random
+import math
+
+######################################
+#
+# Adjustable variables
+#
+######################################
+
+input_file = "MeanConf.vals"
+conf_interval = 0.9
+statistic = "median"	# "median", or a percentile: "p90", "p95", "p99", ...
+
+######################################
+#
+# Subroutines
+#
+######################################
+
+# the quantile a percentile statistic stands for: "p95" is 0.95
+def quantileof(statistic):
+	return float(statistic[1:]) / 100
+
+# returns the k-th smallest of vals (k from 1 to len(vals)) without sorting them:
+# quickselect splits the values around a random one and only keeps the part
+# that holds the k-th smallest, about 2 * len(vals) steps on average
+def select(vals, k):
+	while True:
+		pivot = random.choice(vals)
+		smaller = [val for val in vals if val < pivot]
+		if k <= len(smaller):
+			vals = smaller
+			continue
+		larger = [val for val in vals if val > pivot]
+		num_equal = len(vals) - len(smaller) - len(larger)
+		if k <= len(smaller) + num_equal:
+			return pivot
+		k -= len(smaller) + num_equal
+		vals = larger
+
+# the q quantile of vals (0.5 for the median): the value at position (len(vals) - 1) * q
+# of the sorted values, interpolated between the two values around it
+def quantile(vals, q):
+	pos = (len(vals) - 1) * q
+	low = int(math.floor(pos))
+	low_val = select(vals, low + 1)
+	if pos == low:
+		return low_val
+	return low_val + (pos - low) * (select(vals, low + 2) - low_val)
+
+# returns a list with the probability of exactly j successes in n trials,
+# each with probability p, for j from 0 to n
+# computed with logarithms, so large n does not overflow
+def binomialprobs(n, p):
+	probs = []
+	for j in range(n + 1):
+		log_prob = math.lgamma(n + 1) - math.lgamma(j + 1) - math.lgamma(n - j + 1)
+		log_prob += j * math.log(p) + (n - j) * math.log(1 - p)
+		probs.append(math.exp(log_prob))
+	return probs
+
+######################################
+#
+# Computations
+#
+######################################
+
+sample = []
+
+# file must be in FASTA format
+infile=open(input_file)
+for line in infile:
+	if not line.isspace() and not line.startswith('>'):
+		# line must contain values for previous sample
+		sample += map(float,line.split())
+infile.close()
+
+if statistic == "median":
+	q = 0.5
+	stat_name = "median"
+else:
+	q = quantileof(statistic)
+	stat_name = statistic
+
+n = len(sample)
+observed_quantile = quantile(sample, q)
+
+tails = (1 - conf_interval) / 2
+
+# probs[j] is the chance that exactly j values are below the true quantile
+probs = binomialprobs(n, q)
+
+# the lower bound is the k-th smallest value, for the largest k with
+# a chance of fewer than k values below the quantile of at most tails
+k = 0
+prob_below = 0.0
+while k < n and prob_below + probs[k] <= tails:
+	prob_below += probs[k]
+	k += 1
+
+# the upper bound is the u-th smallest value, for the smallest u with
+# a chance of at least u values below the quantile of at most tails
+u = n + 1
+prob_above = 0.0
+while u > 1 and prob_above + probs[u - 1] <= tails:
+	prob_above += probs[u - 1]
+	u -= 1
+
+# the actual confidence, at least conf_interval
+coverage = 1 - prob_below - prob_above
+
+# k = 0 or u = n + 1: the sample is too small to bound that side
+if k > 0:
+	lower = select(sample, k)
+else:
+	lower = float('-inf')
+if u <= n:
+	upper = select(sample, u)
+else:
+	upper = float('inf')
+
+######################################
+#
+# Output
+#
+######################################
+
+# print observed value and then confidence interval
+print "Observed %s: %.2f" % (stat_name, observed_quantile)
+print "We have", conf_interval * 100, "% confidence that the true", stat_name,
+print "is between: %.2f" % lower, "and %.2f" % upper
+if k == 0 or u > n:
+	print "(with only %d values, one side can not be bounded at this confidence)" % n
+else:
+	print "(the values at positions %d and %d of the %d sorted values, exact confidence %.4f)" % (k, u, n, coverage)
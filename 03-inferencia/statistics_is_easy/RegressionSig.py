@@ -50,9 +50,30 @@
 # 3. counter / 10,000 equals the probability of getting a slope greater than
 #    or equal to 0.0014, assuming x does not predict y
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (3) (set method = "numpy" below).  Shuffling y does not change
+# the x values, so the mean of x and the sum of squares for x are the same for every
+# shuffle, and since the centered x values add up to 0 we do not need the mean of y
+# either.  So b = sum of (x - mean_x) / (sum of squares for x) * y over the pairs:
+# we compute the weights (x - mean_x) / (sum of squares for x) once, and the slope of
+# each shuffle is the sum of the products of the weights and the shuffled y values.
+# The shuffles are drawn chunk_size at a time, as a matrix with one shuffled y
+# per row, and one matrix-vector product gives the slope for all of them.
+#
+# With method = "subset" not even all of y is shuffled.  If x0 is the most common
+# x value, (x - mean_x) = (x - x0) + (x0 - mean_x), and the y values paired with
+# the second part always add up to the sum of all y values, whatever the shuffle.
+# So b = (x0 - mean_x) / (sum of squares for x) * sum(y)
+#      + sum of (x - x0) / (sum of squares for x) * y over the pairs with x != x0,
+# and each shuffle only has to pick the y values for the pairs with x != x0 (a
+# partial Fisher-Yates shuffle of an index into y).  When most pairs share one x
+# value (a treatment given to a few of many, say) a shuffle takes a few steps
+# instead of len(grp_y).
+#
 ######################################
 
 import random
+import numpy
 
 ######################################
 #
@@ -61,6 +82,9 @@ import random
 ######################################
 
 input_file = 'Correlation.vals'
+method = "shuffle"	# "shuffle" (as in the pseudocode), "subset" or "numpy" (batched)
+chunk_size = 100	# number of shuffles drawn at once when method is "numpy",
+			# lower it for very large samples (it uses chunk_size * len(grp_y) values)
 
 ######################################
 #
@@ -124,6 +148,53 @@ def regressionline(grp_x, grp_y):
 	a = mean_y - (b * mean_x)
 	return (a, b)
 
+# same as calling regressionline(grp_x, shuffle([grp_y])[0]) num_shuffles times,
+# but computed chunk_size shuffles at a time with numpy
+# returns an array with the slope (b) of each shuffle
+def batchedslopes(grp_x, grp_y, num_shuffles, chunk_size):
+	x_vals = numpy.array(grp_x, dtype=float)
+	y_vals = numpy.array(grp_y, dtype=float)
+	x_vals -= x_vals.mean()
+	weights = x_vals / (x_vals**2).sum()
+	slopes = numpy.empty(num_shuffles)
+	shuffled = numpy.empty((chunk_size, len(y_vals)))
+	for start in range(0, num_shuffles, chunk_size):
+		num_rows = min(chunk_size, num_shuffles - start)
+		# one shuffled y per row
+		for i in range(num_rows):
+			shuffled[i] = numpy.random.permutation(y_vals)
+		slopes[start:start + num_rows] = shuffled[:num_rows].dot(weights)
+	return slopes
+
+# same as calling regressionline(grp_x, shuffle([grp_y])[0]) num_shuffles times,
+# but each shuffle only picks the y values for the pairs whose x is not the most common x
+# returns a list with the slope (b) of each shuffle
+def subsetslopes(grp_x, grp_y, num_shuffles):
+	count = len(grp_x)
+	mean_x = sum(grp_x) / float(count)
+	sum_of_sq_x = sumofsq(grp_x, mean_x)
+	# the most common x value
+	x_counts = {}
+	for x in grp_x:
+		x_counts[x] = x_counts.get(x, 0) + 1
+	common_x = max(x_counts, key=x_counts.get)
+	weights = [(x - common_x) / sum_of_sq_x for x in grp_x if x != common_x]
+	# the part of the slope that is the same for every shuffle
+	offset = (common_x - mean_x) / sum_of_sq_x * sum(grp_y)
+	# positions of the y values, the picked ones are moved to the front;
+	# whatever order the last shuffle left it in, the next pick is just as random
+	index = range(count)
+	slopes = []
+	for i in range(num_shuffles):
+		slope = offset
+		for k in range(len(weights)):
+			# partial Fisher-Yates: swap a random position from k on into position k
+			j = random.randint(k, count - 1)
+			(index[k], index[j]) = (index[j], index[k])
+			slope += weights[k] * grp_y[index[k]]
+		slopes.append(slope)
+	return slopes
+
 ######################################
 #
 # Computations
@@ -152,11 +223,27 @@ grp_y = samples[1]
 count = 0
 num_shuffles = 10000
 
-for i in range(num_shuffles):
-        new_y_values = shuffle([grp_y])[0]
-        (a, b) = regressionline(grp_x, new_y_values)
-        if ((observed_b >= 0 and b > observed_b) or (observed_b < 0 and b < observed_b)):
-                count = count + 1
+# "numpy" and "subset" add up the slope in a different order than regressionline,
+# so a shuffle that ties the observed slope can come out a rounding error above it:
+# slopes this close to the observed one are ties, and ties do not count
+tolerance = 1e-9 * abs(observed_b)
+
+if method == "numpy":
+        slopes = batchedslopes(grp_x, grp_y, num_shuffles, chunk_size)
+        if observed_b >= 0:
+                count = int(numpy.count_nonzero(slopes > observed_b + tolerance))
+        else:
+                count = int(numpy.count_nonzero(slopes < observed_b - tolerance))
+elif method == "subset":
+        for b in subsetslopes(grp_x, grp_y, num_shuffles):
+                if ((observed_b >= 0 and b > observed_b + tolerance) or (observed_b < 0 and b < observed_b - tolerance)):
+                        count = count + 1
+else:
+        for i in range(num_shuffles):
+                new_y_values = shuffle([grp_y])[0]
+                (a, b) = regressionline(grp_x, new_y_values)
+                if ((observed_b >= 0 and b > observed_b) or (observed_b < 0 and b < observed_b)):
+                        count = count + 1
 
 ######################################
 #
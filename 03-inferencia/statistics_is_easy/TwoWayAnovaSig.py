@@ -92,9 +92,17 @@
 # 3. counter / 10,000 equals the probability of getting a f-statistic greater than or equal to
 #    our observed f-stat (0.93), assuming there is no difference between the groups
 #
+# Included in the code, but NOT in the pseudocode, is a batched numpy
+# version of step (3) (set method = "numpy" below).  All the sums of squares in
+# step (1) can be computed from the number of values, the sum and the sum of
+# squares of each group (each row, column pair), so no lists of values are built.
+# Shuffles are drawn chunk_size at a time, and for each of them we only add up
+# the values and their squares in each group.
+#
 ######################################
 
 import random
+import numpy
 
 ######################################
 #
@@ -103,6 +111,8 @@ import random
 ######################################
 
 input_file = 'TwoWayAnova.vals'
+method = "shuffle"	# "shuffle" (as in the pseudocode) or "numpy" (batched)
+chunk_size = 1000	# number of shuffles drawn at once when method is "numpy"
 
 ######################################
 #
@@ -253,6 +263,59 @@ def twowayanova(grps):
 	# return our f-statistic
 	return interaction_var / within_var
 
+# the same f-statistic as twowayanova, computed for many sets of groups at once
+# from their cell sums alone:
+# counts is a (rows x cols) array with the number of values in each group,
+# sums and sumsqs are (num_sets x rows x cols) arrays with the sum and
+# the sum of squares of the values in each group, for every set of groups
+# returns an array with the f-statistic of each set
+def twowayanovafromsums(counts, sums, sumsqs):
+	num_rows, num_cols = counts.shape
+	num_grps = num_rows * num_cols
+	total_count = counts.sum()
+	total_sum = sums.sum(axis=(1, 2))
+	# (total sum)^2 / total count, removed from each sum of squares below
+	correction = total_sum**2 / total_count
+	within_ss = (sumsqs - sums**2 / counts).sum(axis=(1, 2))
+	between_ss = (sums**2 / counts).sum(axis=(1, 2)) - correction
+	factor_a_ss = (sums.sum(axis=2)**2 / counts.sum(axis=1)).sum(axis=1) - correction
+	factor_b_ss = (sums.sum(axis=1)**2 / counts.sum(axis=0)).sum(axis=1) - correction
+	factor_ss = between_ss - (factor_a_ss + factor_b_ss)
+	between_df = num_grps - 1
+	within_df = total_count - num_grps
+	interaction_df = between_df - (num_rows - 1) - (num_cols - 1)
+	return (factor_ss / interaction_df) / (within_ss / within_df)
+
+# same as calling twowayanova on num_shuffles results of shuffle(grps),
+# but computed chunk_size shuffles at a time with numpy
+# returns an array with the f-statistic of each shuffle
+def batchedtwowayanovas(grps, num_shuffles, chunk_size):
+	num_rows = len(grps)
+	num_cols = len(grps[0])
+	pool = []
+	cell_counts = []
+	for r in range(num_rows):
+		for c in range(num_cols):
+			pool.extend(grps[r][c])
+			cell_counts.append(len(grps[r][c]))
+	pool = numpy.array(pool, dtype=float)
+	# the f-statistic does not change if we move all values by the same amount,
+	# centering them keeps the sums of squares from losing precision
+	pool -= pool.mean()
+	counts = numpy.array(cell_counts, dtype=float).reshape(num_rows, num_cols)
+	# where each group starts in a shuffled pool
+	cell_starts = numpy.cumsum([0] + cell_counts[:-1])
+	f_stats = numpy.empty(num_shuffles)
+	for start in range(0, num_shuffles, chunk_size):
+		num_sets = min(chunk_size, num_shuffles - start)
+		# one shuffled pool per row
+		order = numpy.argsort(numpy.random.random_sample((num_sets, len(pool))), axis=1)
+		shuffled = pool[order]
+		sums = numpy.add.reduceat(shuffled, cell_starts, axis=1).reshape(num_sets, num_rows, num_cols)
+		sumsqs = numpy.add.reduceat(shuffled**2, cell_starts, axis=1).reshape(num_sets, num_rows, num_cols)
+		f_stats[start:start + num_sets] = twowayanovafromsums(counts, sums, sumsqs)
+	return f_stats
+
 ######################################
 #
 # Computations
@@ -288,11 +351,17 @@ observed_f_statistic = twowayanova(samples)
 count = 0
 num_shuffles = 10000
 
-for i in range(num_shuffles):
-	new_samples = shuffle(samples)
-	f_statistic = twowayanova(new_samples)
-	if (f_statistic >= observed_f_statistic):
-		count = count + 1
+if method == "numpy":
+	f_statistics = batchedtwowayanovas(samples, num_shuffles, chunk_size)
+	# the f-statistics are computed from the cell sums, added up in a different order
+	# than twowayanova: f-statistics this close to observed are ties
+	count = int(numpy.count_nonzero(f_statistics >= observed_f_statistic * (1 - 1e-9)))
+else:
+	for i in range(num_shuffles):
+		new_samples = shuffle(samples)
+		f_statistic = twowayanova(new_samples)
+		if (f_statistic >= observed_f_statistic):
+			count = count + 1
 
 
 ######################################
@@ -0,0 +1,36 @@
+######################################
+# Statistics is Easy! tests as an importable package
+#
+# The scripts in the directory above run one test on one input file each time
+# they are started.  This package has the same tests as functions that take the
+# samples and return a result object, so many tests can run in one process:
+#
+#   import resampling
+#   samples = resampling.readfasta('Diff2Mean.vals')
+#   result = resampling.diff2meansig(samples[0], samples[1])
+#   print result.p_value
+#
+# Every resampling test also takes seed and num_workers: with a seed the result
+# is the same whatever the number of worker processes (None for one per CPU).
+# The significance tests take stop= to end early, e.g. stop=resampling.decided(0.05).
+#
+# readfasta, readfastarows, readfastamatrix    fasta.py
+# streaming moments (count, mean, m2)          moments.py
+# the shared subroutines                       primitives.py
+# Fisher's Exact Test, binomial tail           exact.py
+# normal distribution, bias-corrected bounds   normaldist.py
+# process pool, per-chunk random streams       parallel.py
+# early stopping rules for significance tests  sequential.py
+######################################
+
+from .fasta import readfasta, readfastarows, readfastamatrix, readfastamoments, readfastamatrixmoments
+from .moments import Moments, CoMoments, chunkmoments, mergemoments, streammoments, \
+	chunkcomoments, mergecomoments, streamcomoments, onewayanovafrommoments, \
+	twowayanovafrommoments, corrcoeffromcomoments, regressionlinefromcomoments
+from .sequential import besagclifford, decided, either
+from .results import SignificanceResult, ExactResult, ConfidenceResult, QuantileConfidenceResult
+from .significance import diff2meansig, diff2meanexact, pairedsig, onewayanovasig, twowayanovasig, \
+	correlationsig, regressionsig, chisquaredonesig, chisquaredmultisig, coinsig, coinexact, \
+	fishersexactsig, fishersexactmulti
+from .confidence import meanconf, quantileconf, diff2meanconf, onewayanovaconf, twowayanovaconf, \
+	correlationconf, regressionconf
@@ -0,0 +1,162 @@
+######################################
+# Confidence intervals
+#
+# One function per confidence interval script (MeanConf.py, Diff2MeanConf.py, ...).
+# Each takes the samples the script reads from its input file and returns a
+# ConfidenceResult with both the plain and the bias-corrected interval.  The
+# bootstraps are computed chunk_size at a time with numpy, from matrices of
+# resample counts, as in the scripts' "numpy" method, by the chunk function
+# next to each test (see parallel.py for seed and num_workers).
+######################################
+
+import math
+import numpy
+
+from . import exact
+from . import normaldist
+from . import parallel
+from . import primitives
+from .results import ConfidenceResult, QuantileConfidenceResult
+
+# takes the observed statistic and the statistic of every bootstrap
+# and reads both confidence intervals from them
+def confidenceresult(statistic, out, conf_interval):
+	num_resamples = len(out)
+	num_below_observed = int(numpy.count_nonzero(out < statistic))
+	out = numpy.sort(out)
+	tails = (1 - conf_interval) / 2
+	# in case our lower and upper bounds are not integers,
+	# we decrease the range (the values we include in our interval),
+	# so that we can keep the same level of confidence
+	lower_bound = int(math.ceil(num_resamples * tails))
+	upper_bound = min(int(math.floor(num_resamples * (1 - tails))), num_resamples - 1)
+	(bias_corr_lower_bound, bias_corr_upper_bound) = normaldist.biascorrectedbounds(num_below_observed, num_resamples, conf_interval)
+	return ConfidenceResult(statistic, conf_interval, num_resamples,
+		out[lower_bound], out[upper_bound], out[bias_corr_lower_bound], out[bias_corr_upper_bound])
+
+# returns a (num_rows x 2) array, with the sum and the sum of squares
+# of num_rows bootstrap samples of vals
+def bootstrapsums(rng, vals, num_rows):
+	features = numpy.column_stack((vals, vals**2))
+	return primitives.bootstrapcounts(len(vals), num_rows, rng).dot(features)
+
+# MeanConf.py: mean of sample
+def meanchunk(rng, num_rows, vals):
+	return bootstrapsums(rng, vals, num_rows)[:, 0] / float(len(vals))
+
+def meanconf(sample, conf_interval=0.9, num_resamples=10000, chunk_size=100, seed=None, num_workers=1):
+	means = parallel.resample(meanchunk, (numpy.asarray(sample, dtype=float),), num_resamples, chunk_size, seed, num_workers)
+	return confidenceresult(float(primitives.mean(sample)), means, conf_interval)
+
+# QuantileConf.py: exact interval for the q quantile of sample (0.5 for the median),
+# read from its order statistics with no resampling; numpy.partition finds the few
+# values needed in time linear in the size of the sample, without sorting it
+def quantileconf(sample, q=0.5, conf_interval=0.9):
+	vals = numpy.asarray(sample, dtype=float)
+	n = len(vals)
+	(k, u, coverage) = exact.quantileranks(n, q, conf_interval)
+	pos = (n - 1) * q
+	low = int(math.floor(pos))
+	high = min(low + 1, n - 1)
+	# positions in the sorted values, from 0: the bounds and the two values around pos
+	positions = set([low, high])
+	if k > 0:
+		positions.add(k - 1)
+	if u <= n:
+		positions.add(u - 1)
+	vals = numpy.partition(vals, sorted(positions))
+	statistic = float(vals[low] + (pos - low) * (vals[high] - vals[low]))
+	lower = float(vals[k - 1]) if k > 0 else float('-inf')
+	upper = float(vals[u - 1]) if u <= n else float('inf')
+	return QuantileConfidenceResult(statistic, conf_interval, coverage, lower, upper)
+
+# Diff2MeanConf.py and Diff2MeanConfCorr.py: difference between
+# the mean of grpB and the mean of grpA
+def diff2meanchunk(rng, num_rows, vals_a, vals_b):
+	return meanchunk(rng, num_rows, vals_b) - meanchunk(rng, num_rows, vals_a)
+
+# the same with a quantile q of each group instead of its mean (0.5 for the median)
+def diff2quantilechunk(rng, num_rows, vals_a, vals_b, q):
+	boot_b = vals_b[rng.randint(0, len(vals_b), size=(num_rows, len(vals_b)))]
+	boot_a = vals_a[rng.randint(0, len(vals_a), size=(num_rows, len(vals_a)))]
+	return primitives.batchedquantiles(boot_b, q) - primitives.batchedquantiles(boot_a, q)
+
+# with quantile given (0.5 for medians, 0.99 for p99, ...), the interval is for the
+# difference between that quantile of grpB and of grpA instead of the difference of means
+def diff2meanconf(grpA, grpB, conf_interval=0.9, num_resamples=10000, chunk_size=100, seed=None, num_workers=1, quantile=None):
+	args = (numpy.asarray(grpA, dtype=float), numpy.asarray(grpB, dtype=float))
+	if quantile is not None:
+		diffs = parallel.resample(diff2quantilechunk, args + (quantile,), num_resamples, chunk_size, seed, num_workers)
+		return confidenceresult(primitives.quantilediff(grpA, grpB, quantile), diffs, conf_interval)
+	diffs = parallel.resample(diff2meanchunk, args, num_resamples, chunk_size, seed, num_workers)
+	return confidenceresult(float(primitives.meandiff(grpA, grpB)), diffs, conf_interval)
+
+# OneWayAnovaConf.py: f-statistic of a list of groups
+# (grps_vals already centered, see onewayanovaconf)
+def onewayanovachunk(rng, num_rows, grps_vals):
+	grp_sums = numpy.empty((num_rows, len(grps_vals)))
+	total_sumsq = numpy.zeros(num_rows)
+	for g in range(len(grps_vals)):
+		sums = bootstrapsums(rng, grps_vals[g], num_rows)
+		grp_sums[:, g] = sums[:, 0]
+		total_sumsq += sums[:, 1]
+	return primitives.onewayanovafromsums([len(vals) for vals in grps_vals], grp_sums, total_sumsq)
+
+def onewayanovaconf(grps, conf_interval=0.9, num_resamples=10000, chunk_size=100, seed=None, num_workers=1):
+	# the f-statistic does not change if we move all values by the same amount,
+	# centering them keeps the sums of squares from losing precision
+	center = numpy.concatenate(grps).mean()
+	grps_vals = [numpy.asarray(grp, dtype=float) - center for grp in grps]
+	f_stats = parallel.resample(onewayanovachunk, (grps_vals,), num_resamples, chunk_size, seed, num_workers)
+	return confidenceresult(primitives.onewayanova(grps), f_stats, conf_interval)
+
+# TwoWayAnovaConf.py: interaction f-statistic of a matrix (list of rows,
+# each a list of columns) of groups
+def twowayanovachunk(rng, num_sets, grps_vals):
+	num_rows = len(grps_vals)
+	num_cols = len(grps_vals[0])
+	counts = numpy.array([[len(vals) for vals in row] for row in grps_vals], dtype=float)
+	sums = numpy.empty((num_sets, num_rows, num_cols))
+	sumsqs = numpy.empty((num_sets, num_rows, num_cols))
+	for r in range(num_rows):
+		for c in range(num_cols):
+			cell_sums = bootstrapsums(rng, grps_vals[r][c], num_sets)
+			sums[:, r, c] = cell_sums[:, 0]
+			sumsqs[:, r, c] = cell_sums[:, 1]
+	return primitives.twowayanovafromsums(counts, sums, sumsqs)
+
+def twowayanovaconf(grps, conf_interval=0.9, num_resamples=10000, chunk_size=100, seed=None, num_workers=1):
+	center = numpy.concatenate([numpy.concatenate(row) for row in grps]).mean()
+	grps_vals = [[numpy.asarray(grp, dtype=float) - center for grp in row] for row in grps]
+	f_stats = parallel.resample(twowayanovachunk, (grps_vals,), num_resamples, chunk_size, seed, num_workers)
+	return confidenceresult(primitives.twowayanova(grps), f_stats, conf_interval)
+
+# returns a (num_rows x 2) array: r and the slope of the regression line
+# of y on x for num_rows bootstraps of the (x, y) pairs
+# (x_vals and y_vals already centered)
+def pairedbootstrapchunk(rng, num_rows, x_vals, y_vals):
+	n = len(x_vals)
+	# each bootstrap sample only needs these five sums
+	features = numpy.column_stack((x_vals, y_vals, x_vals**2, y_vals**2, x_vals * y_vals))
+	(sum_x, sum_y, sum_xx, sum_yy, sum_xy) = primitives.bootstrapcounts(n, num_rows, rng).dot(features).T
+	sum_of_sq_x = sum_xx - sum_x**2 / n
+	sum_of_sq_y = sum_yy - sum_y**2 / n
+	sum_of_prod = sum_xy - sum_x * sum_y / n
+	return numpy.column_stack((sum_of_prod / numpy.sqrt(sum_of_sq_x * sum_of_sq_y), sum_of_prod / sum_of_sq_x))
+
+# returns two arrays: r and the slope for num_resamples bootstraps of the (x, y) pairs
+def pairedbootstrapstats(x, y, num_resamples, chunk_size, seed=None, num_workers=1):
+	x_vals = numpy.asarray(x, dtype=float) - numpy.mean(x)
+	y_vals = numpy.asarray(y, dtype=float) - numpy.mean(y)
+	stats = parallel.resample(pairedbootstrapchunk, (x_vals, y_vals), num_resamples, chunk_size, seed, num_workers)
+	return (stats[:, 0], stats[:, 1])
+
+# CorrelationConf.py: r between x and y
+def correlationconf(x, y, conf_interval=0.9, num_resamples=10000, chunk_size=100, seed=None, num_workers=1):
+	(rs, slopes) = pairedbootstrapstats(x, y, num_resamples, chunk_size, seed, num_workers)
+	return confidenceresult(float(primitives.corrcoef(x, y)), rs, conf_interval)
+
+# RegressionConf.py: slope of the regression line of y on x
+def regressionconf(x, y, conf_interval=0.9, num_resamples=10000, chunk_size=100, seed=None, num_workers=1):
+	(rs, slopes) = pairedbootstrapstats(x, y, num_resamples, chunk_size, seed, num_workers)
+	return confidenceresult(float(primitives.regressionline(x, y)[1]), slopes, conf_interval)
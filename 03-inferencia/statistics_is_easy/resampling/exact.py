@@ -0,0 +1,502 @@
+######################################
+# Exact tests: nothing is simulated, every possible outcome is accounted for
+#
+# Also the enumeration of every split of a pool of values into groups, used by
+# the permutation tests in significance.py when there are few enough splits.
+######################################
+
+import math
+
+import numpy
+
+# log(n!) for each n we have needed so far
+log_factorials = {}
+
+def log_factorial(n):
+	if n not in log_factorials:
+		log_factorials[n] = math.lgamma(n + 1)
+	return log_factorials[n]
+
+# prob = ((a + b)!(c + d)!(a + c)!(b + d)! / (a!b!c!d!n!)
+# computed with logarithms, so large counts do not overflow
+def prob_of_matrix(a, b, c, d):
+	log_prob = log_factorial(a + b) + log_factorial(c + d) + log_factorial(a + c) + log_factorial(b + d)
+	log_prob -= log_factorial(a) + log_factorial(b) + log_factorial(c) + log_factorial(d) + log_factorial(a + b + c + d)
+	return math.exp(log_prob)
+
+# sums the probability of the matrix
+#   a b
+#   c d
+# and of the matrices with the same row and column totals that come after it
+# (step = 1, a grows) or before it (step = -1, a shrinks)
+# the probability of each matrix is the previous one times the ratio between
+# neighbouring matrices, so only one prob_of_matrix call is needed
+# we must be walking away from the most likely matrix: the probabilities only
+# get smaller, so we can stop as soon as they no longer change the sum
+def sum_of_probs(a, b, c, d, step):
+	prob = prob_of_matrix(a, b, c, d)
+	total = 0.0
+	while prob > 0:
+		total += prob
+		if step == 1:
+			if b == 0 or c == 0:
+				break	# this was the last possible matrix
+			prob = prob * b * c / (float(a + 1) * (d + 1))
+			(a, b, c, d) = (a + 1, b - 1, c - 1, d + 1)
+		else:
+			if a == 0 or d == 0:
+				break	# this was the first possible matrix
+			prob = prob * a * d / (float(b + 1) * (c + 1))
+			(a, b, c, d) = (a - 1, b + 1, c + 1, d - 1)
+		if prob < total * 1e-17:
+			break
+	return total
+
+def fishers_exact_test(a, b, c, d):
+	# now we have to figure out possible outcomes
+	# that are more extreme than ours
+	# and sum the probability of each
+	# this is the part of the code that should be tailored
+	# for your definition of "more extreme"
+	# here we are doing a one-tailed test
+	# where "more extreme" means, more correct answers than
+	# what was observed 
+	# this translates to any matrix where a + d is larger than ours
+	# a_prime + d_prime grows with a_prime, so those are the matrices with a_prime >= a
+
+	# a value of a_prime for the most likely matrix with these row and column totals
+	most_likely_a = (a + b + 1) * (a + c + 1) // (a + b + c + d + 2)
+
+	if a > most_likely_a:
+		# sum the tail itself, walking away from the most likely matrix
+		return sum_of_probs(a, b, c, d, 1)
+	if a == 0 or d == 0:
+		# every possible matrix is as extreme or more extreme than ours
+		return 1.0
+	# the tail holds the most likely matrix, so it is easier to sum the matrices
+	# that are less extreme (again walking away from the most likely one)
+	return 1.0 - sum_of_probs(a - 1, b + 1, c + 1, d - 1, -1)
+
+# lists every matrix with the same row and column totals as
+#   a b
+#   c d
+# and returns the probability, by chance alone, of getting a matrix
+# whose fishers_exact_test is less than or equal to the observed one
+def prob_of_tail_at_most(a, b, c, d):
+	min_a_prime = max(0, a - d)
+	max_a_prime = min(a + b, a + c)
+	# probability of each possible matrix, indexed by a_prime - min_a_prime
+	probs = []
+	for a_prime in range(min_a_prime, max_a_prime + 1):
+		b_prime = a + b - a_prime
+		c_prime = a + c - a_prime
+		d_prime = c + d - c_prime
+		probs.append(prob_of_matrix(a_prime, b_prime, c_prime, d_prime))
+	# a_prime + d_prime grows with a_prime, so the matrices "as extreme or more extreme"
+	# than a given one are that one and all those after it:
+	# its fishers_exact_test is the sum of its probability and all the ones after it
+	tails = probs[:]
+	for i in range(len(tails) - 2, -1, -1):
+		tails[i] += tails[i + 1]
+	observed_tail = tails[a - min_a_prime]
+	total = 0.0
+	for i in range(len(probs)):
+		if tails[i] <= observed_tail:
+			total += probs[i]
+	return total
+
+# returns an array with log(n!) for n from 0 to max_n
+def logfactorials(max_n):
+	log_factorials = numpy.zeros(max_n + 1)
+	log_factorials[1:] = numpy.cumsum(numpy.log(numpy.arange(1, max_n + 1)))
+	return log_factorials
+
+# returns every way of putting col_total values into one column, without putting
+# more in a row than what is left in that row (row_vals), one way per row of a matrix
+def column_fillings(row_vals, col_total):
+	fillings = numpy.zeros((1, 0), dtype=int)
+	# what each way still has to put in the rows after the ones filled so far
+	left = numpy.array([col_total])
+	for r in range(len(row_vals) - 1):
+		# the rows after this one can take at most this much
+		rest = sum(row_vals[r + 1:])
+		vals = numpy.arange(min(row_vals[r], col_total) + 1)
+		# every way so far, with every value for row r that leaves a possible rest
+		new_left = left[:, numpy.newaxis] - vals
+		(ways, picked) = numpy.nonzero((new_left >= 0) & (new_left <= rest))
+		fillings = numpy.column_stack((fillings[ways], vals[picked]))
+		left = new_left[ways, picked]
+	# the last row takes what is left
+	return numpy.column_stack((fillings, left))
+
+# an upper bound on -sum(log(count!)) over every way of filling the columns col_totals
+# with row_vals left in the rows.  -sum(log(count!)) is the same as charging each value
+# a column takes from a row with r left log(r), adding sum(r * log(r)) for the rows, and
+# with that charge the columns need not share the rows any more: each column on its own
+# takes the values worth the most, where the k-th value taken from a row with r left is
+# worth log(r) - log(k).  The largest of these for a column is at least what that column
+# gets in any real way of filling them all, so the sum is an upper bound.
+def max_log_bound(row_vals, col_totals):
+	gains = []
+	charge = 0.0
+	for row_val in row_vals:
+		if row_val > 0:
+			log_row = math.log(row_val)
+			charge += row_val * log_row
+			for k in range(1, row_val + 1):
+				gains.append(log_row - math.log(k))
+	gains.sort(reverse=True)
+	# best[m] is the most m values can be worth
+	best = [0.0]
+	for gain in gains:
+		best.append(best[-1] + gain)
+	total = -charge
+	for col_total in col_totals:
+		total += best[col_total]
+	return total
+
+# a lower bound on the same: each column on its own puts its values in as few rows
+# as possible, filling the rows with the most left first
+def min_log_bound(row_vals, col_totals, log_factorials):
+	total = 0.0
+	for col_total in col_totals:
+		left = col_total
+		for row_val in sorted(row_vals, reverse=True):
+			val = min(row_val, left)
+			total -= log_factorials[val]
+			left -= val
+	return total
+
+# for partial matrices with row_vals left in the rows and the columns col_totals to come
+# returns the largest and the smallest -sum(log(count!)) of the ways to finish them
+# (bounds from above, which also hold with the rows and columns swapped, so we keep
+# the closer of the two), and the log of the sum, over every way to finish them,
+# of 1 / (product of the count in each cell!)
+def finishing_bounds(row_vals, col_totals, log_factorials):
+	if len(col_totals) == 1:
+		# only one way to fill the last column
+		max_log = -log_factorials[list(row_vals)].sum()
+		min_log = max_log
+	else:
+		max_log = min(max_log_bound(row_vals, col_totals), max_log_bound(col_totals, row_vals))
+		min_log = max(min_log_bound(row_vals, col_totals, log_factorials), min_log_bound(col_totals, row_vals, log_factorials))
+	log_all = log_factorials[sum(row_vals)] - log_factorials[list(row_vals) + list(col_totals)].sum()
+	return (max_log, min_log, log_all)
+
+# values are the -sum(log(count!)) of partial matrices so far, counts how many partial
+# matrices have each value: values within tolerance of each other are kept as one
+# returns the values in increasing order, with their counts
+def mergepaths(values, counts, tolerance):
+	keys = numpy.floor(values / tolerance)
+	order = numpy.argsort(keys, kind='mergesort')
+	keys = keys[order]
+	starts = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1])))
+	return (values[order][starts], numpy.add.reduceat(counts[order], starts))
+
+# takes a matrix as a list of rows
+# returns the probability of getting this matrix by chance alone
+# and the probability of getting a matrix with a probability
+# less than or equal to it (None if a column takes more than exact_limit steps:
+# ways of filling it tried, plus partial matrices kept for the next column;
+# with exact_limit None there is no limit)
+def fishers_exact_test_multi(matrix, exact_limit=None):
+	# the counts as whole numbers (readfastarows gives floats)
+	matrix = [[int(val) for val in row] for row in matrix]
+	# fewer rows means fewer different amounts left in the rows
+	if len(matrix) > len(matrix[0]):
+		matrix = [list(col) for col in zip(*matrix)]
+	row_totals = [sum(row) for row in matrix]
+	col_totals = [sum(col) for col in zip(*matrix)]
+	log_factorials = logfactorials(sum(row_totals))
+
+	# every matrix with these totals has probability
+	# exp(log_const - sum(log(count!)))
+	log_const = log_factorials[row_totals + col_totals].sum() - log_factorials[sum(row_totals)]
+	log_observed = log_const - log_factorials[numpy.array(matrix)].sum()
+	# a matrix counts if its -sum(log(count!)) is at most limit
+	# (matrices this much more likely than the observed one still count as equal)
+	limit = log_observed + 1e-7 - log_const
+
+	root = tuple(sorted(row_totals))
+	(max_log, min_log, log_all) = finishing_bounds(root, col_totals, log_factorials)
+	if max_log <= limit:
+		# every matrix counts
+		return (math.exp(log_observed), 1.0)
+
+	prob_tail = 0.0
+	# partial matrices, grouped by what is left in the rows (sorted, since
+	# which row has which amount left does not matter for the columns to come)
+	# for each group we keep (values, counts) arrays of the -sum(log(count!)) so far
+	# of its partial matrices, and how many partial matrices have each value
+	groups = {root: [(numpy.zeros(1), numpy.ones(1))]}
+	for c in range(len(col_totals) - 1):
+		next_groups = {}
+		next_bounds = {}
+		num_steps = 0
+		for row_vals in groups:
+			values = numpy.concatenate([vals for (vals, counts) in groups[row_vals]])
+			counts = numpy.concatenate([counts for (vals, counts) in groups[row_vals]])
+			(values, counts) = mergepaths(values, counts, 1e-9)
+			# weights[i] is the sum of count * exp(value - top) over the i + 1 smallest
+			# values (exp(value) itself is too small for a float in large matrices)
+			top = values[-1]
+			weights = numpy.cumsum(counts * numpy.exp(values - top))
+
+			fillings = column_fillings(row_vals, col_totals[c])
+			num_steps += len(fillings)
+			log_fillings = -log_factorials[fillings].sum(axis=1)
+			next_rows = numpy.sort(numpy.array(row_vals) - fillings, axis=1)
+			# sort the fillings so that those leading to the same group come together,
+			# first is True for the first filling of each group
+			order = numpy.lexsort(next_rows.T)
+			next_rows = next_rows[order]
+			log_fillings = log_fillings[order]
+			first = numpy.concatenate(([True], (next_rows[1:] != next_rows[:-1]).any(axis=1)))
+			next_keys = map(tuple, next_rows[first].tolist())
+			for next_row_vals in next_keys:
+				if next_row_vals not in next_bounds:
+					next_bounds[next_row_vals] = finishing_bounds(next_row_vals, col_totals[c + 1:], log_factorials)
+			which = numpy.cumsum(first) - 1
+			(max_logs, min_logs, log_alls) = numpy.array([next_bounds[key] for key in next_keys]).T[:, which]
+
+			# after each filling, the values up to index low - 1 count for sure (2b),
+			# those from index high on never do (2c), and the ones in between are kept (2d)
+			low = numpy.searchsorted(values, limit - max_logs - log_fillings, side='right')
+			high = numpy.searchsorted(values, limit - min_logs - log_fillings, side='right')
+			counted = low > 0
+			prob_tail += (weights[low[counted] - 1] * numpy.exp(log_const + top + log_fillings[counted] + log_alls[counted])).sum()
+
+			# values[low:high] + log_filling for each filling, all in one array
+			num_vals = high - low
+			ends = numpy.cumsum(num_vals)
+			index = numpy.arange(ends[-1]) - numpy.repeat(ends - num_vals - low, num_vals)
+			kept_values = values[index] + numpy.repeat(log_fillings, num_vals)
+			kept_counts = counts[index]
+			num_steps += ends[-1]
+			if exact_limit is not None and num_steps > exact_limit:
+				return (math.exp(log_observed), None)
+			# the kept values of each next group come one after another
+			group_ends = ends[numpy.append(numpy.flatnonzero(first[1:]), len(first) - 1)]
+			group_starts = numpy.concatenate(([0], group_ends[:-1]))
+			for g in numpy.flatnonzero(group_ends > group_starts):
+				kept = (kept_values[group_starts[g]:group_ends[g]], kept_counts[group_starts[g]:group_ends[g]])
+				next_groups.setdefault(next_keys[g], []).append(kept)
+		groups = next_groups
+	return (math.exp(log_observed), min(prob_tail, 1.0))
+
+# returns the exact probability of getting at least k successes
+# out of n trials, when each trial succeeds with probability p
+# computed with logarithms, so large n does not overflow
+def prob_at_least(k, n, p):
+	if k <= 0:
+		return 1.0
+	if k > n:
+		return 0.0
+	if p <= 0 or p >= 1:
+		# every trial fails, or every trial succeeds
+		return float(p >= 1)
+	total = 0.0
+	for j in range(k, n + 1):
+		log_prob = math.lgamma(n + 1) - math.lgamma(j + 1) - math.lgamma(n - j + 1)
+		log_prob += j * math.log(p) + (n - j) * math.log(1 - p)
+		total += math.exp(log_prob)
+	return min(total, 1.0)
+
+# probability of at most k successes in n trials, each with probability p
+def prob_at_most(k, n, p):
+	return prob_at_least(n - k, n, 1 - p)
+
+# for a confidence interval of the q quantile from a sample of n values (see QuantileConf.py):
+# the number of values below the true quantile has a binomial distribution,
+# and returns (k, u, coverage), where the k-th and u-th smallest values (counting from 1)
+# hold the true quantile between them with probability coverage, at least conf_interval
+# k is 0 (or u is n + 1) if the sample is too small to bound that side
+def quantileranks(n, q, conf_interval):
+	tails = (1 - conf_interval) / 2
+	# log of C(n, j) q^j (1 - q)^(n - j) for j from 0 to n, each term from the one before
+	j = numpy.arange(1, n + 1)
+	log_probs = numpy.empty(n + 1)
+	log_probs[0] = n * math.log(1 - q)
+	numpy.cumsum(numpy.log(n - j + 1) - numpy.log(j) + math.log(q / (1 - q)), out=log_probs[1:])
+	log_probs[1:] += log_probs[0]
+	probs = numpy.exp(log_probs)
+	# below[j] is the chance of at most j values below the quantile, above[j] the chance of at least n - j
+	below = numpy.cumsum(probs)
+	above = numpy.cumsum(probs[::-1])
+	# the largest k with a chance of fewer than k values below of at most tails,
+	# and the smallest u with a chance of at least u values below of at most tails
+	k = min(int(numpy.searchsorted(below, tails, side='right')), n)
+	u = max(n + 1 - int(numpy.searchsorted(above, tails, side='right')), 1)
+	coverage = 1.0
+	if k > 0:
+		coverage -= below[k - 1]
+	if u <= n:
+		coverage -= above[n - u]
+	return (k, u, float(coverage))
+
+# number of different ways to split len(vals) values into groups of sizes counts
+# (two splits differ if some value is in a different group)
+# if limit is given, stops counting as soon as there are more than limit
+# (and returns a number above limit), so huge groups cost nothing
+def numsplits(counts, limit=None):
+	total = 1
+	left = sum(counts)
+	for count in counts:
+		# choose the members of this group from the values left:
+		# C(left, k) = (left - k + 1) / 1 * (left - k + 2) / 2 * ... * left / k
+		k = min(count, left - count)
+		for i in range(1, k + 1):
+			total = total * (left - k + i) // i
+			if limit is not None and total > limit:
+				return total
+		left -= count
+	return total
+
+# walks through every way of choosing t of the positions 0 .. n - 1 in revolving
+# door order (Knuth, The Art of Computer Programming 7.2.1.3, Algorithm R): the
+# first choice is 0 .. t - 1, and each next one swaps one position out and one in
+# yields (out, in) for each step, C(n, t) - 1 steps in all
+def revolvingdoor(n, t):
+	if t == 0 or t == n:
+		return
+	if t == 1:
+		# the algorithm needs t > 1, one position just walks along
+		for i in range(n - 1):
+			yield (i, i + 1)
+		return
+	# c[1] < c[2] < ... < c[t] are the chosen positions, c[t + 1] = n is a sentinel
+	c = [None] + list(range(t)) + [n]
+	while True:
+		if t % 2 == 1:
+			if c[1] + 1 < c[2]:
+				yield (c[1], c[1] + 1)
+				c[1] += 1
+				continue
+			j = 2
+			decrease = True
+		else:
+			if c[1] > 0:
+				yield (c[1], c[1] - 1)
+				c[1] -= 1
+				continue
+			j = 2
+			decrease = False
+		while True:
+			if decrease:
+				# try to decrease c[j]
+				if c[j] >= j:
+					yield (c[j], j - 2)
+					(c[j], c[j - 1]) = (c[j - 1], j - 2)
+					break
+				j += 1
+			else:
+				# try to increase c[j]
+				if c[j] + 1 < c[j + 1]:
+					yield (c[j - 1], c[j] + 1)
+					(c[j - 1], c[j]) = (c[j], c[j] + 1)
+					break
+				j += 1
+				if j > t:
+					return
+			decrease = not decrease
+
+# returns a (numsplits(counts) x len(counts)) array with the sum of each group,
+# for every way of splitting vals into groups of sizes counts
+# the first group walks through its choices in revolving door order, so its sum
+# changes by one add and one subtract per split; the second to last group is
+# treated the same way for every choice of the groups before it, and the last
+# group gets whatever is left
+def splitsums(vals, counts):
+	vals = numpy.asarray(vals, dtype=float)
+	if len(counts) == 1:
+		return numpy.array([[vals.sum()]])
+	steps = numpy.array(list(revolvingdoor(len(vals), counts[0])), dtype=int).reshape(-1, 2)
+	first_sums = numpy.empty(len(steps) + 1)
+	first_sums[0] = vals[:counts[0]].sum()
+	numpy.cumsum(vals[steps[:, 1]] - vals[steps[:, 0]], out=first_sums[1:])
+	first_sums[1:] += first_sums[0]
+	if len(counts) == 2:
+		return numpy.column_stack((first_sums, vals.sum() - first_sums))
+	# more than two groups: split what is left after each choice of the first group
+	in_first = numpy.zeros(len(vals), dtype=bool)
+	in_first[:counts[0]] = True
+	sums = []
+	for i in range(len(first_sums)):
+		if i > 0:
+			in_first[steps[i - 1, 0]] = False
+			in_first[steps[i - 1, 1]] = True
+		rest_sums = splitsums(vals[~in_first], counts[1:])
+		sums.append(numpy.column_stack((numpy.repeat(first_sums[i], len(rest_sums)), rest_sums)))
+	return numpy.concatenate(sums)
+
+# returns an array with the sum of vals for every one of the 2^len(vals) ways of
+# flipping their signs, in Gray code order: step i flips the sign of the value at
+# the lowest bit set in i, so each sum is the one before it plus one change
+def signflipsums(vals):
+	vals = numpy.asarray(vals, dtype=float)
+	steps = numpy.arange(1, 2**len(vals))
+	# the lowest bit set in each step, and whether that value was negated before it
+	flipped = numpy.log2(steps & -steps).astype(int)
+	before = steps - 1
+	negated = ((before ^ (before >> 1)) >> flipped) & 1
+	changes = numpy.where(negated == 1, 2.0, -2.0) * vals[flipped]
+	sums = numpy.empty(2**len(vals))
+	sums[0] = vals.sum()
+	numpy.cumsum(changes, out=sums[1:])
+	sums[1:] += sums[0]
+	return sums
+
+# vals are whole numbers, at least 0
+# returns an array probs, where probs[s] is the probability that num_picked of vals,
+# picked at random without replacement, add up to s, for s from 0 to max_sum
+# computed by dynamic programming over (values seen, values picked, sum) instead of
+# trying every pick: after i values, row k holds the probabilities of the sums of
+# k values picked from those i, and value i + 1 is in such a pick with probability k / (i + 1)
+# sums only grow as values are added, so sums above max_sum are never needed
+def subsetsumprobs(vals, num_picked, max_sum):
+	vals = [int(val) for val in vals]
+	n = len(vals)
+	probs = numpy.zeros((num_picked + 1, max_sum + 1))
+	probs[0, 0] = 1.0
+	for i in range(1, n + 1):
+		val = vals[i - 1]
+		# rows that can still grow to num_picked with the values left
+		low = max(1, num_picked - (n - i))
+		top = min(i, num_picked)
+		k = numpy.arange(low, top + 1)[:, numpy.newaxis]
+		new_probs = ((i - k) / float(i)) * probs[low:top + 1]
+		if val <= max_sum:
+			# picks of k that include this value: a pick of k - 1 before it, plus val
+			new_probs[:, val:] += (k / float(i)) * probs[low - 1:top, :max_sum + 1 - val]
+		probs[low:top + 1] = new_probs
+	return probs[num_picked]
+
+# vals are whole numbers: returns the probability that the sum of num_picked
+# of them, picked at random without replacement, is at most limit
+# (at least limit, if at_least is True)
+def prob_of_subset_sum(vals, num_picked, limit, at_least=False):
+	vals = [int(val) for val in vals]
+	if at_least:
+		# a sum of at least limit is a sum of at most -limit for the negated values
+		vals = [-val for val in vals]
+		limit = -limit
+	# moving every value by the same amount moves every sum of num_picked values by
+	# num_picked times that amount, and dividing by a common factor divides the sums by it,
+	# both keep the table of sums small
+	low = min(vals)
+	shifted = [val - low for val in vals]
+	factor = 0
+	for val in shifted:
+		factor = gcd(factor, val)
+	factor = max(factor, 1)
+	# the limit in the units of the table, rounded down so only sums at most limit count
+	max_sum = int(math.floor((limit - num_picked * low) / float(factor)))
+	if max_sum < 0:
+		return 0.0
+	max_sum = min(max_sum, sum(sorted(shifted, reverse=True)[:num_picked]) // factor)
+	return float(subsetsumprobs([val // factor for val in shifted], num_picked, max_sum).sum())
+
+def gcd(a, b):
+	while b:
+		(a, b) = (b, a % b)
+	return a
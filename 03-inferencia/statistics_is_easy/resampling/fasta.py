@@ -0,0 +1,89 @@
+######################################
+# Readers for the FASTA formatted input files used by the scripts
+######################################
+
+from . import moments
+
+# returns a list of lists, one per sample (one per line starting with '>'),
+# with the values of that sample, as in Diff2Mean.vals or OneWayAnova.vals
+def readfasta(input_file):
+	samples = []
+	infile = open(input_file)
+	for line in infile:
+		if line.startswith('>'):
+			# start of new sample
+			samples.append([])
+		elif not line.isspace():
+			# line must contain values for previous sample
+			samples[-1] += [float(val) for val in line.split()]
+	infile.close()
+	return samples
+
+# returns a list of rows, as in chisquaredmulti.vals or fishersexact.vals:
+# the lines starting with '>' are ignored, every other line is one row
+def readfastarows(input_file, convert=float):
+	rows = []
+	infile = open(input_file)
+	for line in infile:
+		if not line.isspace() and not line.startswith('>'):
+			rows.append([convert(val) for val in line.split()])
+	infile.close()
+	return rows
+
+# returns a matrix (list of rows, each a list of columns) of samples, as in
+# TwoWayAnova.vals: the last two tokens of each line starting with '>' are
+# the row and column (starting at 1) of the sample that follows
+def readfastamatrix(input_file):
+	samples = []
+	r = 0
+	c = 0
+	infile = open(input_file)
+	for line in infile:
+		if line.startswith('>'):
+			tokens = line.split()
+			c = int(tokens[-1]) - 1
+			r = int(tokens[-2]) - 1
+			# make sure we have enough rows, and that row has enough columns
+			while r >= len(samples):
+				samples.append([])
+			while c >= len(samples[r]):
+				samples[r].append([])
+		elif not line.isspace():
+			samples[r][c] += [float(val) for val in line.split()]
+	infile.close()
+	return samples
+
+# same as readfasta, but returns the Moments of each sample instead of its values
+# one line is read at a time, so the file does not have to fit in memory
+def readfastamoments(input_file):
+	samples = []
+	infile = open(input_file)
+	for line in infile:
+		if line.startswith('>'):
+			samples.append(moments.empty_moments)
+		elif not line.isspace():
+			line_moments = moments.chunkmoments([float(val) for val in line.split()])
+			samples[-1] = moments.mergemoments(samples[-1], line_moments)
+	infile.close()
+	return samples
+
+# same as readfastamatrix, but returns the Moments of each sample instead of its values
+def readfastamatrixmoments(input_file):
+	samples = []
+	r = 0
+	c = 0
+	infile = open(input_file)
+	for line in infile:
+		if line.startswith('>'):
+			tokens = line.split()
+			c = int(tokens[-1]) - 1
+			r = int(tokens[-2]) - 1
+			while r >= len(samples):
+				samples.append([])
+			while c >= len(samples[r]):
+				samples[r].append(moments.empty_moments)
+		elif not line.isspace():
+			line_moments = moments.chunkmoments([float(val) for val in line.split()])
+			samples[r][c] = moments.mergemoments(samples[r][c], line_moments)
+	infile.close()
+	return samples
@@ -0,0 +1,146 @@
+######################################
+# Streaming moments
+#
+# Summaries of a set of values that can be built one chunk at a time and
+# merged, so the values never have to be in memory all at once:
+#   Moments(count, mean, m2)  m2 is the sum of squares (sumofsq(vals, mean))
+#   CoMoments(count, mean_x, mean_y, m2_x, m2_y, c_xy)
+#                             c_xy is the sum of products (sumofproducts(x, y, mean_x, mean_y))
+# Merging uses the pairwise update of Chan, Golub and LeVeque, so no value is
+# ever subtracted from a large running sum of squares, which keeps them precise.
+# The statistics at the bottom (f-statistics, r, the regression line) are
+# computed from these summaries alone.
+######################################
+
+from collections import namedtuple
+
+import numpy
+
+Moments = namedtuple('Moments', ['count', 'mean', 'm2'])
+CoMoments = namedtuple('CoMoments', ['count', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c_xy'])
+
+empty_moments = Moments(0, 0.0, 0.0)
+empty_comoments = CoMoments(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+######################################
+#
+# Building and merging
+#
+######################################
+
+# summary of one chunk of values
+def chunkmoments(vals):
+	vals = numpy.asarray(vals, dtype=float)
+	if len(vals) == 0:
+		return empty_moments
+	mean = vals.mean()
+	return Moments(len(vals), float(mean), float(((vals - mean)**2).sum()))
+
+# summary of the values of a and of b together
+def mergemoments(a, b):
+	if a.count == 0:
+		return b
+	if b.count == 0:
+		return a
+	count = a.count + b.count
+	delta = b.mean - a.mean
+	mean = a.mean + delta * b.count / float(count)
+	m2 = a.m2 + b.m2 + delta**2 * a.count * b.count / float(count)
+	return Moments(count, mean, m2)
+
+# summary of all the values in an iterable of chunks (lists or arrays),
+# reading one chunk at a time
+def streammoments(chunks):
+	total = empty_moments
+	for chunk in chunks:
+		total = mergemoments(total, chunkmoments(chunk))
+	return total
+
+# summary of one chunk of (x, y) pairs
+def chunkcomoments(x, y):
+	x = numpy.asarray(x, dtype=float)
+	y = numpy.asarray(y, dtype=float)
+	if len(x) == 0:
+		return empty_comoments
+	mean_x = x.mean()
+	mean_y = y.mean()
+	dx = x - mean_x
+	dy = y - mean_y
+	return CoMoments(len(x), float(mean_x), float(mean_y), float((dx**2).sum()), float((dy**2).sum()), float((dx * dy).sum()))
+
+def mergecomoments(a, b):
+	if a.count == 0:
+		return b
+	if b.count == 0:
+		return a
+	count = a.count + b.count
+	weight = a.count * b.count / float(count)
+	delta_x = b.mean_x - a.mean_x
+	delta_y = b.mean_y - a.mean_y
+	return CoMoments(count,
+		a.mean_x + delta_x * b.count / float(count),
+		a.mean_y + delta_y * b.count / float(count),
+		a.m2_x + b.m2_x + delta_x**2 * weight,
+		a.m2_y + b.m2_y + delta_y**2 * weight,
+		a.c_xy + b.c_xy + delta_x * delta_y * weight)
+
+# summary of all the pairs in an iterable of (x chunk, y chunk) pairs
+def streamcomoments(chunks):
+	total = empty_comoments
+	for (x, y) in chunks:
+		total = mergecomoments(total, chunkcomoments(x, y))
+	return total
+
+######################################
+#
+# Statistics
+#
+######################################
+
+# f-statistic of a one-way ANOVA, from the Moments of each group
+def onewayanovafrommoments(grp_moments):
+	total = empty_moments
+	for grp in grp_moments:
+		total = mergemoments(total, grp)
+	num_grps = len(grp_moments)
+	within_ss = sum([grp.m2 for grp in grp_moments])
+	between_ss = sum([grp.count * (grp.mean - total.mean)**2 for grp in grp_moments])
+	between_var = between_ss / (num_grps - 1)
+	within_var = within_ss / (total.count - num_grps)
+	return between_var / within_var
+
+# interaction f-statistic of a two-way ANOVA, from a matrix (list of rows,
+# each a list of columns) of the Moments of each group
+def twowayanovafrommoments(cell_moments):
+	num_rows = len(cell_moments)
+	num_cols = len(cell_moments[0])
+	num_grps = num_rows * num_cols
+	factor_a = [empty_moments] * num_rows
+	factor_b = [empty_moments] * num_cols
+	total = empty_moments
+	within_ss = 0.0
+	for r in range(num_rows):
+		for c in range(num_cols):
+			cell = cell_moments[r][c]
+			factor_a[r] = mergemoments(factor_a[r], cell)
+			factor_b[c] = mergemoments(factor_b[c], cell)
+			total = mergemoments(total, cell)
+			within_ss += cell.m2
+	factor_a_ss = sum([cat.count * (cat.mean - total.mean)**2 for cat in factor_a])
+	factor_b_ss = sum([cat.count * (cat.mean - total.mean)**2 for cat in factor_b])
+	between_ss = total.m2 - within_ss
+	factor_ss = between_ss - (factor_a_ss + factor_b_ss)
+	between_df = num_grps - 1
+	within_df = total.count - num_grps
+	interaction_df = between_df - (num_rows - 1) - (num_cols - 1)
+	return (factor_ss / interaction_df) / (within_ss / within_df)
+
+# r, from the CoMoments of the pairs
+def corrcoeffromcomoments(pairs):
+	return pairs.c_xy / numpy.sqrt(pairs.m2_x * pairs.m2_y)
+
+# (a, b) for the line of best fit y' = bx + a, from the CoMoments of the pairs
+def regressionlinefromcomoments(pairs):
+	b = pairs.c_xy / pairs.m2_x
+	a = pairs.mean_y - (b * pairs.mean_x)
+	return (a, b)
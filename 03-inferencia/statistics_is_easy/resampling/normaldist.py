@@ -0,0 +1,120 @@
+######################################
+# Standard Normal Distribution
+#
+# Shared by the bias-corrected confidence interval scripts (MeanConf.py,
+# Diff2MeanConfCorr.py, CorrelationConf.py, RegressionConf.py, OneWayAnovaConf.py
+# and TwoWayAnovaConf.py) and by confidence.py.
+#
+# cdf(z) is the proportion of the standard normal distribution below z (phi(z)),
+# inverse_cdf(p) is the z that has a proportion p of the distribution below it
+# (phi^-1(p)).  Both take a single number or a numpy array of any shape and work on
+# every entry at once, so the bounds of thousands of intervals can be computed
+# in one call with biascorrectedbounds.
+#
+# cdf uses the rational approximation of Hart (1968), as given by West (2005),
+# "Better approximations to cumulative normal functions": the error is below 1e-15
+# (and below 1e-8 of the answer itself far in the tails).  inverse_cdf starts from
+# the rational approximation of Acklam, and then takes one step of Halley's method
+# with cdf, which brings it to about the same accuracy.
+#
+######################################
+
+import math
+import numpy
+
+######################################
+#
+# Subroutines
+#
+######################################
+
+# coefficients for cdf, highest power first
+cdf_num = [3.52624965998911e-02, 0.700383064443688, 6.37396220353165, 33.912866078383,
+	112.079291497871, 221.213596169931, 220.206867912376]
+cdf_den = [8.83883476483184e-02, 1.75566716318264, 16.064177579207, 86.7807322029461,
+	296.564248779674, 637.333633378831, 793.826512519948, 440.413735824752]
+
+# coefficients for inverse_cdf, highest power first
+inv_a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+	1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+inv_b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+	6.680131188771972e+01, -1.328068155288572e+01, 1.0]
+inv_c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+	-2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+inv_d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+	3.754408661907416e+00, 1.0]
+# below this proportion (and above 1 minus it) inverse_cdf uses the tail approximation
+inv_p_low = 0.02425
+
+sqrt_2_pi = math.sqrt(2 * math.pi)
+
+# returns the proportion of the standard normal distribution below z
+def cdf(z):
+	z = numpy.asarray(z, dtype=float)
+	abs_z = numpy.abs(z)
+	exponential = numpy.exp(-abs_z**2 / 2)
+	# close to the center: a ratio of two polynomials
+	near = exponential * numpy.polyval(cdf_num, abs_z) / numpy.polyval(cdf_den, abs_z)
+	# far in the tails: a continued fraction
+	build = abs_z + 0.65
+	for k in [4, 3, 2, 1]:
+		build = abs_z + k / build
+	far = exponential / build / sqrt_2_pi
+	# proportion of the distribution beyond abs_z
+	tail = numpy.where(abs_z < 7.07106781186547, near, far)
+	tail = numpy.where(abs_z > 37, 0.0, tail)
+	area = numpy.where(z > 0, 1 - tail, tail)
+	if area.ndim == 0:
+		return float(area)
+	return area
+
+# returns the z with a proportion p of the standard normal distribution below it
+# gives -inf for p = 0 and inf for p = 1
+def inverse_cdf(p):
+	p = numpy.asarray(p, dtype=float)
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		# center
+		q = p - 0.5
+		r = q * q
+		z = q * numpy.polyval(inv_a, r) / numpy.polyval(inv_b, r)
+		# tails, computed on the smaller of p and 1 - p
+		tail_p = numpy.minimum(p, 1 - p)
+		s = numpy.sqrt(-2 * numpy.log(tail_p))
+		tail_z = numpy.polyval(inv_c, s) / numpy.polyval(inv_d, s)
+		z = numpy.where(p < inv_p_low, tail_z, z)
+		z = numpy.where(p > 1 - inv_p_low, -tail_z, z)
+		# one step of Halley's method
+		e = cdf(z) - p
+		u = e * sqrt_2_pi * numpy.exp(z * z / 2)
+		refined = z - u / (1 + z * u / 2)
+		z = numpy.where(numpy.isfinite(refined), refined, z)
+	z = numpy.where(p <= 0, -numpy.inf, numpy.where(p >= 1, numpy.inf, z))
+	if z.ndim == 0:
+		return float(z)
+	return z
+
+# Efron's bias-corrected interval: given how many of num_resamples bootstrap values
+# were below the observed value, returns the indexes of the lower and upper bound of
+# the conf_interval confidence interval among the sorted bootstrap values
+# num_below_observed (and num_resamples) can be arrays, one entry per analysis
+def biascorrectedbounds(num_below_observed, num_resamples, conf_interval):
+	num_below_observed = numpy.asarray(num_below_observed, dtype=float)
+	num_resamples = numpy.asarray(num_resamples)
+	# proportion of bootstrap values below the observed value
+	p = num_below_observed / num_resamples
+	z_0 = inverse_cdf(p)
+	z_alpha_over_2 = inverse_cdf((1 - conf_interval) / 2.0)
+	z_1_minus_alpha_over_2 = -z_alpha_over_2
+	# in case our lower and upper bounds are not integers,
+	# we decrease the range (the values we include in our interval),
+	# so that we can keep the same level of confidence
+	with numpy.errstate(invalid='ignore'):
+		lower_bound = numpy.ceil(num_resamples * cdf(z_alpha_over_2 + (2 * z_0)))
+		upper_bound = numpy.floor(num_resamples * cdf(z_1_minus_alpha_over_2 + (2 * z_0)))
+	# every bootstrap value was on the same side of the observed value:
+	# the bound is the first (or the last) bootstrap value
+	lower_bound = numpy.clip(numpy.nan_to_num(lower_bound), 0, num_resamples - 1).astype(int)
+	upper_bound = numpy.clip(numpy.nan_to_num(upper_bound), 0, num_resamples - 1).astype(int)
+	if lower_bound.ndim == 0:
+		return (int(lower_bound), int(upper_bound))
+	return (lower_bound, upper_bound)
@@ -0,0 +1,64 @@
+######################################
+# Running the resamples of a test on many processes
+#
+# The resamples are split in chunks of chunk_size, and chunk i always draws
+# its random numbers from its own stream, numpy.random.RandomState([seed, i]).
+# So the statistics (and the p-value or interval read from them) only depend on
+# the seed and chunk_size, not on how many processes computed the chunks or in
+# what order they finished.
+######################################
+
+import multiprocessing
+
+import numpy
+
+# the random stream of one chunk of resamples
+def chunkstream(seed, chunk_index):
+	return numpy.random.RandomState([seed, chunk_index])
+
+# the seed the chunk streams are made from: the given one, or one drawn
+# from numpy.random, so that numpy.random.seed still makes a run repeatable
+def baseseed(seed):
+	if seed is None:
+		return int(numpy.random.randint(0, 2**31 - 1))
+	return seed
+
+# the chunk function and its arguments, set once in every worker process
+# so the samples are not sent again with every chunk
+worker_job = None
+
+def startworker(chunkfunc, args):
+	global worker_job
+	worker_job = (chunkfunc, args)
+
+def runchunk(task):
+	(seed, chunk_index, num_rows) = task
+	(chunkfunc, args) = worker_job
+	return chunkfunc(chunkstream(seed, chunk_index), num_rows, *args)
+
+# chunkfunc(rng, num_rows, *args) returns an array with the statistics of
+# num_rows resamples drawn with rng (one row, or one value, per resample)
+# yields the statistics of num_resamples resamples, chunk_size at a time and in
+# chunk order, computed by num_workers processes (None for one per CPU)
+# if the caller stops reading early, the workers are stopped too
+def resamplechunks(chunkfunc, args, num_resamples, chunk_size, seed=None, num_workers=1):
+	seed = baseseed(seed)
+	tasks = []
+	for start in range(0, num_resamples, chunk_size):
+		tasks.append((seed, len(tasks), min(chunk_size, num_resamples - start)))
+	if num_workers == 1:
+		for (chunk_seed, chunk_index, num_rows) in tasks:
+			yield chunkfunc(chunkstream(chunk_seed, chunk_index), num_rows, *args)
+		return
+	pool = multiprocessing.Pool(num_workers, startworker, (chunkfunc, args))
+	try:
+		# imap returns the chunks in order, whichever worker finished first
+		for stats in pool.imap(runchunk, tasks):
+			yield stats
+	finally:
+		pool.terminate()
+		pool.join()
+
+# the statistics of all num_resamples resamples in one array
+def resample(chunkfunc, args, num_resamples, chunk_size, seed=None, num_workers=1):
+	return numpy.concatenate(list(resamplechunks(chunkfunc, args, num_resamples, chunk_size, seed, num_workers)))
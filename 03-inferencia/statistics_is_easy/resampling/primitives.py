@@ -0,0 +1,223 @@
+######################################
+# Subroutines shared by the tests
+#
+# One numpy version of the subroutines each script carries its own copy of
+# (bootstrap, shuffle, sumofsq, weightedsumofsq, sumofproducts, ...), plus the
+# batched building blocks that compute a statistic for many resamples at once.
+######################################
+
+import math
+import numpy
+
+from . import moments
+
+######################################
+#
+# Statistics
+#
+######################################
+
+def mean(vals):
+	return numpy.mean(vals)
+
+# subtracts group a mean from group b mean and returns result
+def meandiff(grpA, grpB):
+	return numpy.mean(grpB) - numpy.mean(grpA)
+
+# the q quantile of each row of vals (0.5 for the median): the value at position
+# (n - 1) * q of the sorted row, interpolated between the two values around it
+# numpy.partition only puts the one or two values needed in their sorted places,
+# in time linear in the length of the rows, instead of sorting every row
+def batchedquantiles(vals, q):
+	vals = numpy.asarray(vals, dtype=float)
+	n = vals.shape[-1]
+	pos = (n - 1) * q
+	low = int(math.floor(pos))
+	high = min(low + 1, n - 1)
+	vals = numpy.partition(vals, sorted(set([low, high])), axis=-1)
+	return vals[..., low] + (pos - low) * (vals[..., high] - vals[..., low])
+
+def quantile(vals, q):
+	return float(batchedquantiles(vals, q))
+
+# subtracts the group a quantile from the group b quantile and returns result
+def quantilediff(grpA, grpB, q):
+	return quantile(grpB, q) - quantile(grpA, q)
+
+# sum of the squared difference of each value and the mean
+def sumofsq(vals, mean):
+	vals = numpy.asarray(vals, dtype=float)
+	return float(((vals - mean)**2).sum())
+
+# sum of the squared difference of each value and the mean, times the weight of the value
+def weightedsumofsq(vals, weights, mean):
+	vals = numpy.asarray(vals, dtype=float)
+	return float((numpy.asarray(weights) * (vals - mean)**2).sum())
+
+def sumofproducts(x_vals, y_vals, mean_x, mean_y):
+	x_vals = numpy.asarray(x_vals, dtype=float)
+	y_vals = numpy.asarray(y_vals, dtype=float)
+	return float(((x_vals - mean_x) * (y_vals - mean_y)).sum())
+
+def corrcoef(x, y):
+	return float(moments.corrcoeffromcomoments(moments.chunkcomoments(x, y)))
+
+# returns (a, b) for the line of best fit y' = bx + a
+def regressionline(x, y):
+	return moments.regressionlinefromcomoments(moments.chunkcomoments(x, y))
+
+# works along the last axis, so observed can hold one set of counts per row
+def chisquared(expected, observed):
+	expected = numpy.asarray(expected, dtype=float)
+	observed = numpy.asarray(observed, dtype=float)
+	return ((observed - expected)**2 / expected).sum(axis=-1)
+
+# the one-way ANOVA f-statistic computed for many sets of groups at once
+# from their sums alone:
+# counts holds the number of values in each group,
+# sums is a (num_sets x num_groups) array with the sum of each group, for every set,
+# total_sumsq is the sum of the squares of all values in each set (one number
+# if it is the same for every set, as it is when we shuffle)
+# returns an array with the f-statistic of each set
+def onewayanovafromsums(counts, sums, total_sumsq):
+	counts = numpy.asarray(counts, dtype=float)
+	total_count = counts.sum()
+	num_grps = len(counts)
+	total_sum = sums.sum(axis=1)
+	grp_ss = (sums**2 / counts).sum(axis=1)
+	between_ss = grp_ss - total_sum**2 / total_count
+	within_ss = total_sumsq - grp_ss
+	return (between_ss / (num_grps - 1)) / (within_ss / (total_count - num_grps))
+
+def onewayanova(grps):
+	return moments.onewayanovafrommoments([moments.chunkmoments(grp) for grp in grps])
+
+# the two-way ANOVA interaction f-statistic computed for many sets of groups at once
+# from their cell sums alone:
+# counts is a (rows x cols) array with the number of values in each group,
+# sums and sumsqs are (num_sets x rows x cols) arrays with the sum and
+# the sum of squares of the values in each group, for every set of groups
+# returns an array with the f-statistic of each set
+def twowayanovafromsums(counts, sums, sumsqs):
+	counts = numpy.asarray(counts, dtype=float)
+	num_rows, num_cols = counts.shape
+	num_grps = num_rows * num_cols
+	total_count = counts.sum()
+	total_sum = sums.sum(axis=(1, 2))
+	# (total sum)^2 / total count, removed from each sum of squares below
+	correction = total_sum**2 / total_count
+	within_ss = (sumsqs - sums**2 / counts).sum(axis=(1, 2))
+	between_ss = (sums**2 / counts).sum(axis=(1, 2)) - correction
+	factor_a_ss = (sums.sum(axis=2)**2 / counts.sum(axis=1)).sum(axis=1) - correction
+	factor_b_ss = (sums.sum(axis=1)**2 / counts.sum(axis=0)).sum(axis=1) - correction
+	factor_ss = between_ss - (factor_a_ss + factor_b_ss)
+	between_df = num_grps - 1
+	within_df = total_count - num_grps
+	interaction_df = between_df - (num_rows - 1) - (num_cols - 1)
+	return (factor_ss / interaction_df) / (within_ss / within_df)
+
+# takes a matrix (list of rows, each a list of columns) of groups
+def twowayanova(grps):
+	return moments.twowayanovafrommoments([[moments.chunkmoments(grp) for grp in row] for row in grps])
+
+######################################
+#
+# Resampling
+#
+# Each of these draws its random numbers from rng, a numpy.random.RandomState
+# (numpy.random itself by default), so a chunk of resamples can have a stream of its own
+#
+######################################
+
+# returns one bootstrap sample of x (picked with replacement, same size as x)
+def bootstrap(x, rng=numpy.random):
+	x = numpy.asarray(x)
+	return x[rng.randint(0, len(x), size=len(x))]
+
+# returns a num_rows x n matrix, each row holds the number of times
+# each of the n original values was picked in one bootstrap sample
+def bootstrapcounts(n, num_rows, rng=numpy.random):
+	index = rng.randint(0, n, size=(num_rows, n))
+	# shift each row's indexes so every row counts into its own n bins
+	index += numpy.arange(num_rows)[:, numpy.newaxis] * n
+	return numpy.bincount(index.ravel(), minlength=num_rows * n).reshape(num_rows, n)
+
+# pools all values of a list of groups, shuffles them, and makes
+# new groups of the same size as the original groups
+def shuffle(grps, rng=numpy.random):
+	pool = rng.permutation(numpy.concatenate(grps))
+	ends = numpy.cumsum([len(grp) for grp in grps])
+	return numpy.split(pool, ends[:-1])
+
+# returns a num_rows x len(vals) matrix, each row a shuffled copy of vals
+def shuffledrows(vals, num_rows, rng=numpy.random):
+	vals = numpy.asarray(vals)
+	shuffled = numpy.empty((num_rows, len(vals)), dtype=vals.dtype)
+	for i in range(num_rows):
+		shuffled[i] = rng.permutation(vals)
+	return shuffled
+
+# returns a num_rows x num_picked matrix, each row the indexes of num_picked
+# values picked at random (without replacement) from n values
+# (which values are picked is random, the order they are listed in is not)
+def pickedindexes(n, num_picked, num_rows, rng=numpy.random):
+	if num_picked * num_picked <= n:
+		# Floyd's algorithm: for j from n - num_picked to n - 1, pick a random index
+		# from 0 to j, or j itself if that one was picked already
+		# num_picked^2 steps per row instead of n, for small picks from many values
+		picked = numpy.empty((num_rows, num_picked), dtype=int)
+		for i in range(num_picked):
+			j = n - num_picked + i
+			new_index = rng.randint(0, j + 1, size=num_rows)
+			seen = (picked[:, :i] == new_index[:, numpy.newaxis]).any(axis=1)
+			picked[:, i] = numpy.where(seen, j, new_index)
+		return picked
+	# give every value a random key in every row,
+	# the values with the num_picked smallest keys are picked
+	keys = rng.random_sample((num_rows, n))
+	return numpy.argpartition(keys, num_picked - 1, axis=1)[:, :num_picked]
+
+# numpy.random.hypergeometric, except a sample of size 0 is allowed (and gives 0)
+def hypergeometric(ngood, nbad, nsample, rng=numpy.random):
+	empty = nsample == 0
+	draws = rng.hypergeometric(numpy.where(empty, 1, ngood), nbad, numpy.where(empty, 1, nsample))
+	return numpy.where(empty, 0, draws)
+
+# for a pool with many ties: values are the distinct values in the pool, value_counts
+# how many times each appears, and counts the sizes of the groups
+# returns a num_rows x len(counts) matrix with the sum of each group in num_rows
+# shuffles of the pool, each drawn as how many copies of each value every group
+# gets (a multivariate hypergeometric draw, see sampletables), so a shuffle costs
+# len(values) * len(counts) draws however many values the pool holds
+def tiedgroupsums(values, value_counts, counts, num_rows, rng=numpy.random):
+	tables = sampletables(value_counts, counts, num_rows, rng).reshape(num_rows, len(values), len(counts))
+	return numpy.einsum('rvg,v->rg', tables, numpy.asarray(values, dtype=float))
+
+# draws num_tables random matrices with the given row and column totals
+# (the same distribution as shuffling the observations) using sequential hypergeometric draws
+# returns a num_tables x (num_rows * num_cols) array, each row ordered row by row
+def sampletables(row_totals, column_totals, num_tables, rng=numpy.random):
+	num_rows = len(row_totals)
+	num_cols = len(column_totals)
+	tables = numpy.zeros((num_tables, num_rows * num_cols), dtype=numpy.int64)
+	# keeps track of the available values for each column, in every table
+	available_column_vals = numpy.empty((num_tables, num_cols), dtype=numpy.int64)
+	available_column_vals[:] = numpy.array(column_totals, dtype=numpy.int64)
+	for r in range(num_rows - 1):
+		# the values of this row still to be placed
+		left_in_row = numpy.empty(num_tables, dtype=numpy.int64)
+		left_in_row[:] = int(row_totals[r])
+		# values available in this column and the columns after it
+		left_in_cols = available_column_vals.sum(axis=1)
+		for c in range(num_cols):
+			left_in_cols -= available_column_vals[:, c]
+			if c == num_cols - 1:
+				new_vals = left_in_row
+			else:
+				new_vals = hypergeometric(available_column_vals[:, c], left_in_cols, left_in_row, rng)
+			tables[:, r * num_cols + c] = new_vals
+			available_column_vals[:, c] -= new_vals
+			left_in_row = left_in_row - new_vals
+	# the last row gets whatever is left in each column
+	tables[:, (num_rows - 1) * num_cols:] = available_column_vals
+	return tables
@@ -0,0 +1,29 @@
+######################################
+# What the tests in significance.py and confidence.py return
+######################################
+
+from collections import namedtuple
+
+# statistic: the observed value of the test statistic
+# count: how many of the num_resamples resamples were as extreme or more extreme
+# (for a test that tried every possible split, num_resamples is the number of splits)
+# p_value: count / num_resamples
+SignificanceResult = namedtuple('SignificanceResult', ['statistic', 'count', 'num_resamples', 'p_value'])
+
+# statistic: the observed value of the test statistic (for Fisher's Exact Test,
+# the probability of the observed matrix or of its tail)
+# p_value: the exact probability, no resampling involved
+ExactResult = namedtuple('ExactResult', ['statistic', 'p_value'])
+
+# statistic: the observed value of the statistic
+# lower, upper: the conf_interval confidence interval read from the sorted bootstrap values
+# bias_corrected_lower, bias_corrected_upper: the same, with Efron's bias correction
+ConfidenceResult = namedtuple('ConfidenceResult', ['statistic', 'conf_interval', 'num_resamples',
+	'lower', 'upper', 'bias_corrected_lower', 'bias_corrected_upper'])
+
+# statistic: the observed quantile
+# coverage: the exact probability that the interval holds the true quantile, at least conf_interval
+# lower, upper: the values of the sample that bound the interval (-inf or inf if the
+# sample is too small to bound that side)
+QuantileConfidenceResult = namedtuple('QuantileConfidenceResult', ['statistic', 'conf_interval', 'coverage',
+	'lower', 'upper'])
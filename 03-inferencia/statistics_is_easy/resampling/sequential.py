@@ -0,0 +1,46 @@
+######################################
+# Stopping rules for sequential significance tests
+#
+# Pass one of these as stop= to a significance test: after every chunk of
+# resamples the test calls stop(count, num_resamples) with how many resamples
+# so far were as extreme or more extreme than observed, and stops resampling as
+# soon as it returns True.  The result holds the number of resamples actually
+# done, and p_value is count / num_resamples as usual.
+#
+# The check happens once per chunk, so a smaller chunk_size (100, say) lets a
+# clearly null test stop sooner.
+######################################
+
+from . import exact
+
+# Besag and Clifford (1991): stop once min_count resamples were as extreme as
+# observed.  The p-value min_count / num_resamples then has a relative standard
+# error of about 1 / sqrt(min_count) (min_count = 10 gives about 30%, 100 about 10%),
+# whatever the true p-value, and large p-values are settled after very few resamples.
+# If min_count is never reached, the test runs all of its resamples.
+def besagclifford(min_count=10):
+	def stop(count, num_resamples):
+		return count >= min_count
+	return stop
+
+# stop once it is clear whether the p-value is above or below alpha: if the
+# true p-value were alpha, getting a count this far from num_resamples * alpha
+# would have a probability below risk.  The risk is taken at every check, so the
+# chance of a wrong decision is at most risk times the number of chunks.
+def decided(alpha=0.05, risk=0.001):
+	def stop(count, num_resamples):
+		# so many extreme resamples that the p-value is clearly above alpha
+		if exact.prob_at_least(count, num_resamples, alpha) < risk:
+			return True
+		# so few that it is clearly below
+		return exact.prob_at_most(count, num_resamples, alpha) < risk
+	return stop
+
+# stop as soon as any of the rules says so
+def either(*rules):
+	def stop(count, num_resamples):
+		for rule in rules:
+			if rule(count, num_resamples):
+				return True
+		return False
+	return stop
@@ -0,0 +1,351 @@
+######################################
+# Significance tests
+#
+# One function per significance script (Diff2MeanSig.py, OneWayAnovaSig.py, ...).
+# Each takes the samples the script reads from its input file and returns a
+# SignificanceResult (or an ExactResult for the exact tests).  The resamples
+# are computed chunk_size at a time with numpy, as in the scripts' "numpy" method,
+# by the chunk function next to each test (see parallel.py for seed and num_workers).
+# Passing a stop rule from sequential.py ends the resampling as soon as the answer is known.
+######################################
+
+import numpy
+
+from . import exact
+from . import parallel
+from . import primitives
+from .results import SignificanceResult, ExactResult
+
+# which of the values are as extreme or more extreme than observed:
+# greater than or equal to it if it is positive (or zero), less than or equal if negative;
+# the resamples are computed differently than observed, so values this close to it
+# (towards zero) are ties
+def isextreme(vals, observed):
+	threshold = observed * (1 - 1e-9)
+	if observed < 0:
+		return vals <= threshold
+	return vals >= threshold
+
+# reads the statistics of the resamples chunk by chunk, and counts those for which
+# extreme(stats) is true; if a stop rule is given (see sequential.py) it is checked
+# after every chunk, and no more chunks are read once it returns True
+# returns the count and the number of resamples read
+def countresamples(chunks, extreme, stop=None):
+	count = 0
+	num_resamples = 0
+	for stats in chunks:
+		count += int(numpy.count_nonzero(extreme(stats)))
+		num_resamples += len(stats)
+		if stop is not None and stop(count, num_resamples):
+			break
+	# stops the workers, if we stopped early
+	chunks.close()
+	return (count, num_resamples)
+
+def significanceresult(statistic, count, num_resamples):
+	return SignificanceResult(statistic, count, num_resamples, count / float(num_resamples))
+
+# Diff2MeanSig.py: difference between the mean of grpB and the mean of grpA
+def diff2meanchunk(rng, num_rows, pool, len_a, len_b):
+	total = pool.sum()
+	# we only pick the members of the smaller group,
+	# the rest of the pool goes to the other group
+	picked_sum = pool[primitives.pickedindexes(len(pool), min(len_a, len_b), num_rows, rng)].sum(axis=1)
+	if len_a <= len_b:
+		(sum_a, sum_b) = (picked_sum, total - picked_sum)
+	else:
+		(sum_a, sum_b) = (total - picked_sum, picked_sum)
+	return sum_b / float(len_b) - sum_a / float(len_a)
+
+# the same for a pool with few distinct values, kept as (value, count) pairs
+def diff2meantiedchunk(rng, num_rows, values, value_counts, len_a, len_b):
+	sums = primitives.tiedgroupsums(values, value_counts, [len_a, len_b], num_rows, rng)
+	return sums[:, 1] / float(len_b) - sums[:, 0] / float(len_a)
+
+# diff2meanchunk with a quantile q of each group instead of its mean (0.5 for the median)
+def diff2quantilechunk(rng, num_rows, pool, len_a, q):
+	# the values with the len_a smallest random keys form group a, the rest group b
+	keys = rng.random_sample((num_rows, len(pool)))
+	shuffled = pool[numpy.argpartition(keys, len_a - 1, axis=1)]
+	return primitives.batchedquantiles(shuffled[:, len_a:], q) - primitives.batchedquantiles(shuffled[:, :len_a], q)
+
+# if there are at most exact_limit ways to split the pool into the two groups,
+# every one of them is tried instead of shuffling (num_resamples is then the number of splits)
+# with quantile given (0.5 for medians, 0.99 for p99, ...), tests the difference
+# between that quantile of grpB and of grpA instead of the difference of means,
+# always by shuffling
+def diff2meansig(grpA, grpB, num_shuffles=10000, chunk_size=1000, seed=None, num_workers=1, stop=None, exact_limit=100000, quantile=None):
+	pool = numpy.concatenate((grpA, grpB)).astype(float)
+	if quantile is None:
+		observed = primitives.meandiff(grpA, grpB)
+	else:
+		observed = primitives.quantilediff(grpA, grpB, quantile)
+	# the group sums below are added up in a different order than meandiff, and tied
+	# values often give a shuffle the very same means: differences this close to observed are ties
+	tolerance = 1e-9 * numpy.abs(pool).max()
+	if observed < 0:
+		extreme = lambda diffs: diffs <= observed + tolerance
+	else:
+		extreme = lambda diffs: diffs >= observed - tolerance
+	if quantile is not None:
+		chunks = parallel.resamplechunks(diff2quantilechunk, (pool, len(grpA), quantile), num_shuffles, chunk_size, seed, num_workers)
+		(count, num_resamples) = countresamples(chunks, extreme, stop)
+		return significanceresult(observed, count, num_resamples)
+	if exact.numsplits([len(grpA), len(grpB)], exact_limit) <= exact_limit:
+		sums = exact.splitsums(pool, [len(grpA), len(grpB)])
+		diffs = sums[:, 1] / float(len(grpB)) - sums[:, 0] / float(len(grpA))
+		return significanceresult(observed, int(numpy.count_nonzero(extreme(diffs))), len(diffs))
+	(values, value_counts) = numpy.unique(pool, return_counts=True)
+	num_picked = min(len(grpA), len(grpB))
+	# a hypergeometric draw costs about ten times as much as moving one value,
+	# so with few enough distinct values drawing counts is cheaper than picking values
+	# (which costs num_picked^2, or len(pool) for larger groups, see pickedindexes)
+	if len(values) * 2 * 10 <= min(len(pool), num_picked * num_picked):
+		(chunkfunc, args) = (diff2meantiedchunk, (values, value_counts, len(grpA), len(grpB)))
+	else:
+		(chunkfunc, args) = (diff2meanchunk, (pool, len(grpA), len(grpB)))
+	chunks = parallel.resamplechunks(chunkfunc, args, num_shuffles, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, extreme, stop)
+	return significanceresult(observed, count, num_resamples)
+
+# Diff2MeanSig.py, exact version for whole-number values (counts, milliseconds, ...):
+# the difference of means only depends on the sum of grpA, and the chance of each
+# sum of a group of that size is worked out by dynamic programming over the
+# possible sums, so large groups take no longer than the range of their values allows
+def diff2meanexact(grpA, grpB):
+	pool = list(grpA) + list(grpB)
+	if [val for val in pool if val != int(val)]:
+		raise ValueError("diff2meanexact needs whole numbers, scale the values first")
+	observed = primitives.meandiff(grpA, grpB)
+	# mean of grpB - mean of grpA shrinks as the sum of grpA grows,
+	# so as extreme or more extreme means a sum of grpA at most (or at least) the observed one
+	# work with the smaller group: the sum of the other one is the total minus its sum
+	sum_a = int(sum(grpA))
+	if len(grpA) <= len(grpB):
+		(num_picked, limit, at_least) = (len(grpA), sum_a, observed < 0)
+	else:
+		(num_picked, limit, at_least) = (len(grpB), int(sum(pool)) - sum_a, observed >= 0)
+	return ExactResult(observed, exact.prob_of_subset_sum(pool, num_picked, limit, at_least))
+
+# PairedSig.py: mean of the differences after - before, with a random sign for each pair
+def pairedchunk(rng, num_rows, diffs):
+	signs = 2 * rng.randint(0, 2, size=(num_rows, len(diffs))) - 1
+	return signs.dot(diffs) / float(len(diffs))
+
+# if there are at most exact_limit pairs, every one of the 2^n ways to flip the signs
+# is tried instead (num_resamples is then 2^n): the sums of each half of the pairs
+# are listed for every way of flipping that half, and for every sum of the first half
+# a binary search in the sorted sums of the second half counts the extreme ones
+def pairedsig(before, after, num_flips=10000, chunk_size=1000, seed=None, num_workers=1, stop=None, exact_limit=30):
+	if len(before) != len(after):
+		raise ValueError("pairedsig needs the same number of values before and after")
+	diffs = numpy.asarray(after, dtype=float) - numpy.asarray(before, dtype=float)
+	observed = diffs.mean()
+	# sums added up in a different order than observed, this close to it, are ties
+	tolerance = 1e-9 * numpy.abs(diffs).max()
+	if len(diffs) <= exact_limit:
+		half = len(diffs) // 2
+		first_sums = exact.signflipsums(diffs[:half])
+		second_sums = numpy.sort(exact.signflipsums(diffs[half:]))
+		limits = observed * len(diffs) - first_sums
+		if observed < 0:
+			count = numpy.searchsorted(second_sums, limits + tolerance * len(diffs), side='right').sum()
+		else:
+			count = (len(second_sums) - numpy.searchsorted(second_sums, limits - tolerance * len(diffs), side='left')).sum()
+		return significanceresult(observed, int(count), len(first_sums) * len(second_sums))
+	if observed < 0:
+		extreme = lambda means: means <= observed + tolerance
+	else:
+		extreme = lambda means: means >= observed - tolerance
+	chunks = parallel.resamplechunks(pairedchunk, (diffs,), num_flips, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, extreme, stop)
+	return significanceresult(observed, count, num_resamples)
+
+# OneWayAnovaSig.py: f-statistic of a list of groups
+def onewayanovachunk(rng, num_rows, pool, counts):
+	# where each group starts in a shuffled pool
+	grp_starts = numpy.cumsum([0] + counts[:-1])
+	# the same for every shuffle
+	total_sumsq = (pool**2).sum()
+	shuffled = primitives.shuffledrows(pool, num_rows, rng)
+	grp_sums = numpy.add.reduceat(shuffled, grp_starts, axis=1)
+	return primitives.onewayanovafromsums(counts, grp_sums, total_sumsq)
+
+# the same for a pool with few distinct values, kept as (value, count) pairs
+def onewayanovatiedchunk(rng, num_rows, values, value_counts, counts):
+	total_sumsq = (value_counts * values**2).sum()
+	grp_sums = primitives.tiedgroupsums(values, value_counts, counts, num_rows, rng)
+	return primitives.onewayanovafromsums(counts, grp_sums, total_sumsq)
+
+# if there are at most exact_limit ways to split the pool into groups of these sizes,
+# every one of them is tried instead of shuffling (num_resamples is then the number of splits)
+def onewayanovasig(grps, num_shuffles=10000, chunk_size=1000, seed=None, num_workers=1, stop=None, exact_limit=100000):
+	pool = numpy.concatenate(grps).astype(float)
+	# the f-statistic does not change if we move all values by the same amount
+	pool -= pool.mean()
+	counts = [len(grp) for grp in grps]
+	observed = primitives.onewayanova(grps)
+	# f-statistics this close to observed are ties, the difference is rounding
+	extreme = lambda f_stats: f_stats >= observed * (1 - 1e-9)
+	if exact.numsplits(counts, exact_limit) <= exact_limit:
+		f_stats = primitives.onewayanovafromsums(counts, exact.splitsums(pool, counts), (pool**2).sum())
+		return significanceresult(observed, int(numpy.count_nonzero(extreme(f_stats))), len(f_stats))
+	(values, value_counts) = numpy.unique(pool, return_counts=True)
+	# a hypergeometric draw costs about ten times as much as moving one value
+	if len(values) * len(counts) * 10 <= len(pool):
+		(chunkfunc, args) = (onewayanovatiedchunk, (values, value_counts, counts))
+	else:
+		(chunkfunc, args) = (onewayanovachunk, (pool, counts))
+	chunks = parallel.resamplechunks(chunkfunc, args, num_shuffles, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, extreme, stop)
+	return significanceresult(observed, count, num_resamples)
+
+# TwoWayAnovaSig.py: interaction f-statistic of a matrix (list of rows,
+# each a list of columns) of groups
+def twowayanovachunk(rng, num_sets, pool, counts):
+	(num_rows, num_cols) = counts.shape
+	cell_starts = numpy.cumsum([0] + list(counts.ravel()[:-1].astype(int)))
+	shuffled = primitives.shuffledrows(pool, num_sets, rng)
+	sums = numpy.add.reduceat(shuffled, cell_starts, axis=1).reshape(num_sets, num_rows, num_cols)
+	sumsqs = numpy.add.reduceat(shuffled**2, cell_starts, axis=1).reshape(num_sets, num_rows, num_cols)
+	return primitives.twowayanovafromsums(counts, sums, sumsqs)
+
+def twowayanovasig(grps, num_shuffles=10000, chunk_size=1000, seed=None, num_workers=1, stop=None):
+	cells = [grp for row in grps for grp in row]
+	pool = numpy.concatenate(cells).astype(float)
+	pool -= pool.mean()
+	counts = numpy.array([[len(grp) for grp in row] for row in grps], dtype=float)
+	observed = primitives.twowayanova(grps)
+	chunks = parallel.resamplechunks(twowayanovachunk, (pool, counts), num_shuffles, chunk_size, seed, num_workers)
+	# f-statistics this close to observed are ties, the difference is rounding
+	(count, num_resamples) = countresamples(chunks, lambda f_stats: f_stats >= observed * (1 - 1e-9), stop)
+	return significanceresult(observed, count, num_resamples)
+
+# CorrelationSig.py: r between x and y
+# x_vals and y_vals are centered and scaled to length 1, so r is their dot product
+def correlationchunk(rng, num_rows, x_vals, y_vals):
+	return primitives.shuffledrows(y_vals, num_rows, rng).dot(x_vals)
+
+def correlationsig(x, y, num_shuffles=10000, chunk_size=100, seed=None, num_workers=1, stop=None):
+	x_vals = numpy.asarray(x, dtype=float) - numpy.mean(x)
+	y_vals = numpy.asarray(y, dtype=float) - numpy.mean(y)
+	x_vals /= numpy.sqrt((x_vals**2).sum())
+	y_vals /= numpy.sqrt((y_vals**2).sum())
+	observed = float(x_vals.dot(y_vals))
+	if observed == 0:
+		# no direction to look in, nothing counts (as in the script)
+		return significanceresult(observed, 0, num_shuffles)
+	chunks = parallel.resamplechunks(correlationchunk, (x_vals, y_vals), num_shuffles, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, lambda rs: isextreme(rs, observed), stop)
+	return significanceresult(observed, count, num_resamples)
+
+# RegressionSig.py: slope of the regression line of y on x
+# the slope is the dot product of y with weights (x - mean of x) / sumofsq(x)
+def regressionchunk(rng, num_rows, weights, y_vals):
+	return primitives.shuffledrows(y_vals, num_rows, rng).dot(weights)
+
+# the same when most x share one value x0: (x - mean of x) = (x - x0) + (x0 - mean of x),
+# and the y values times the second part add up to offset for every shuffle, so only
+# the y values paired with the other x (weights (x - x0) / sumofsq(x)) are picked
+def regressionsubsetchunk(rng, num_rows, weights, y_vals, offset):
+	picked = primitives.pickedindexes(len(y_vals), len(weights), num_rows, rng)
+	# pickedindexes does not list the picked values in a random order, shuffle them
+	order = numpy.argsort(rng.random_sample(picked.shape), axis=1)
+	picked = picked[numpy.arange(num_rows)[:, numpy.newaxis], order]
+	return offset + y_vals[picked].dot(weights)
+
+def regressionsig(x, y, num_shuffles=10000, chunk_size=100, seed=None, num_workers=1, stop=None):
+	x_vals = numpy.asarray(x, dtype=float)
+	y_vals = numpy.asarray(y, dtype=float)
+	sum_of_sq_x = ((x_vals - x_vals.mean())**2).sum()
+	(x_uniques, x_counts) = numpy.unique(x_vals, return_counts=True)
+	common_x = x_uniques[x_counts.argmax()]
+	num_other = len(x_vals) - x_counts.max()
+	if num_other * num_other <= len(x_vals):
+		weights = (x_vals[x_vals != common_x] - common_x) / sum_of_sq_x
+		offset = (common_x - x_vals.mean()) / sum_of_sq_x * y_vals.sum()
+		(chunkfunc, args) = (regressionsubsetchunk, (weights, y_vals, offset))
+	else:
+		(chunkfunc, args) = (regressionchunk, ((x_vals - x_vals.mean()) / sum_of_sq_x, y_vals))
+	(observed_a, observed) = primitives.regressionline(x, y)
+	chunks = parallel.resamplechunks(chunkfunc, args, num_shuffles, chunk_size, seed, num_workers)
+	# the script counts strictly greater (or less) slopes; the slopes here are added up
+	# in a different order than regressionline, so slopes this close to observed are ties
+	tolerance = 1e-9 * abs(observed)
+	if observed >= 0:
+		extreme = lambda slopes: slopes > observed + tolerance
+	else:
+		extreme = lambda slopes: slopes < observed - tolerance
+	(count, num_resamples) = countresamples(chunks, extreme, stop)
+	return significanceresult(observed, count, num_resamples)
+
+# ChiSquaredOne.py: chi-squared of observed counts against expected counts
+def chisquaredonechunk(rng, num_rows, expected, num_observations):
+	simulated = rng.multinomial(num_observations, expected / expected.sum(), size=num_rows)
+	return primitives.chisquared(expected, simulated)
+
+def chisquaredonesig(expected, observed, num_runs=10000, chunk_size=1000, seed=None, num_workers=1, stop=None):
+	expected_vals = numpy.asarray(expected, dtype=float)
+	statistic = float(primitives.chisquared(expected_vals, observed))
+	chunks = parallel.resamplechunks(chisquaredonechunk, (expected_vals, int(sum(observed))), num_runs, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, lambda chi_squareds: chi_squareds >= statistic, stop)
+	return significanceresult(statistic, count, num_resamples)
+
+# ChiSquaredMulti.py: chi-squared of a matrix (list of rows) of counts
+# against the counts expected from its row and column totals
+def chisquaredmultichunk(rng, num_rows, expected, row_totals, column_totals):
+	tables = primitives.sampletables(row_totals, column_totals, num_rows, rng)
+	return primitives.chisquared(expected, tables)
+
+def chisquaredmultisig(matrix, num_runs=10000, chunk_size=1000, seed=None, num_workers=1, stop=None):
+	observed = numpy.asarray(matrix, dtype=float)
+	row_totals = observed.sum(axis=1)
+	column_totals = observed.sum(axis=0)
+	expected = (numpy.outer(row_totals, column_totals) / observed.sum()).ravel()
+	statistic = float(primitives.chisquared(expected, observed.ravel()))
+	chunks = parallel.resamplechunks(chisquaredmultichunk, (expected, row_totals, column_totals), num_runs, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, lambda chi_squareds: chi_squareds >= statistic, stop)
+	return significanceresult(statistic, count, num_resamples)
+
+# CoinSig.py: at least heads successes out of tosses, each with probability p
+def coinchunk(rng, num_rows, tosses, p):
+	return rng.binomial(tosses, p, size=num_rows)
+
+def coinsig(heads, tosses, p, num_runs=10000, chunk_size=1000, seed=None, num_workers=1, stop=None):
+	chunks = parallel.resamplechunks(coinchunk, (tosses, p), num_runs, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, lambda successes: successes >= heads, stop)
+	return significanceresult(heads, count, num_resamples)
+
+# CoinSig.py, exact version
+def coinexact(heads, tosses, p):
+	return ExactResult(heads, exact.prob_at_least(heads, tosses, p))
+
+# FishersExactTestSig.py, exact version: for the matrix
+#   a b
+#   c d
+# statistic is its (one-tailed) Fisher's Exact Test, p_value the probability of
+# getting a matrix with a Fisher's Exact Test less than or equal to it
+def fishersexactsig(a, b, c, d):
+	return ExactResult(exact.fishers_exact_test(a, b, c, d), exact.prob_of_tail_at_most(a, b, c, d))
+
+# FishersExactTestMulti.py: -sum(log(count!)) of random matrices with the given
+# row and column totals (the probability of a matrix only depends on it)
+def fishersexactmultichunk(rng, num_rows, row_totals, column_totals, log_factorials):
+	tables = primitives.sampletables(row_totals, column_totals, num_rows, rng)
+	return -log_factorials[tables].sum(axis=1)
+
+# FishersExactTestMulti.py: statistic is the probability of the matrix (list of rows),
+# p_value the probability of getting a matrix as likely as it or less
+# if a column of the exact test takes more than exact_limit steps, the p_value is
+# estimated from num_runs random matrices with the same totals instead (a SignificanceResult)
+def fishersexactmulti(matrix, num_runs=10000, chunk_size=1000, seed=None, num_workers=1, stop=None, exact_limit=10000000):
+	(observed_prob, prob_tail) = exact.fishers_exact_test_multi(matrix, exact_limit)
+	if prob_tail is not None:
+		return ExactResult(observed_prob, prob_tail)
+	counts = numpy.asarray(matrix, dtype=numpy.int64)
+	log_factorials = exact.logfactorials(int(counts.sum()))
+	# matrices this much more likely than the observed one still count as equal
+	limit = -log_factorials[counts].sum() + 1e-7
+	chunks = parallel.resamplechunks(fishersexactmultichunk, (counts.sum(axis=1), counts.sum(axis=0), log_factorials), num_runs, chunk_size, seed, num_workers)
+	(count, num_resamples) = countresamples(chunks, lambda log_probs: log_probs <= limit, stop)
+	return significanceresult(observed_prob, count, num_resamples)